@@ -1,67 +1,251 @@
 from flask import Flask, request
-from queue import Queue
-from services.webhook import send_webhook
+from services.webhook import send_webhook, start_webhook_dispatcher
+from services import job_queue
+from services.admission import ADMISSION_CONTROL, estimate_job_cost, check_admission, projected_drain_time
+from services.runtime_model import estimate_schedule
+from services import upload_stage
+from services import workspace
+from services.janitor import start_janitor
+from services.whisper_models import start_preload
 import threading
 import uuid
 import os
 import time
+import zlib
+import functools
+import logging
 from version import BUILD_NUMBER  # Import the BUILD_NUMBER
 
 MAX_QUEUE_LENGTH = int(os.environ.get('MAX_QUEUE_LENGTH', 0))
 
+# Identical requests (same endpoint and payload, ignoring webhook_url and id) share one job,
+# and a successful result is reused for RESULT_CACHE_TTL seconds (0 = only while in flight)
+COALESCE_REQUESTS = os.environ.get('COALESCE_REQUESTS', 'true').lower() == 'true'
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+
+# Number of concurrent job slots per worker for each job class
+JOB_CLASS_WORKERS = {
+    'whisper': int(os.environ.get('WHISPER_WORKERS', 1)),
+    'ffmpeg': int(os.environ.get('FFMPEG_WORKERS', 2)),
+    'io': int(os.environ.get('IO_WORKERS', 4)),
+}
+DEFAULT_JOB_CLASS = 'ffmpeg'
+
+# Gunicorn worker processes sharing the job queue (gunicorn reads the same variable)
+WORKER_PROCESSES = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# Seconds a job slot waits after an unexpected error before taking the next job
+SLOT_ERROR_BACKOFF = float(os.environ.get('SLOT_ERROR_BACKOFF', 2))
+
+logger = logging.getLogger(__name__)
+
 def create_app():
     app = Flask(__name__)
 
-    # Create a queue to hold tasks
-    task_queue = Queue()
-    queue_id = id(task_queue)  # Generate a single queue_id for this worker
+    # All workers share one queue database, with one lane per job class so
+    # short jobs don't wait behind long ones
+    job_queue.init_queue()
+    start_webhook_dispatcher()
+    start_janitor()
+    start_preload()
+    queue_id = zlib.crc32(job_queue.JOB_QUEUE_DB.encode())  # Same queue_id on every worker
+    queue_length = job_queue.queue_length
+
+    # Wakes this worker's idle threads as soon as it enqueues a job itself;
+    # jobs enqueued by other workers are picked up on the next poll
+    job_added = {job_class: threading.Event() for job_class in JOB_CLASS_WORKERS}
 
-    # Function to process tasks from the queue
-    def process_queue():
+    # Function to process tasks from one job class queue
+    def process_queue(job_class):
         while True:
-            job_id, data, task_func, queue_start_time = task_queue.get()
-            queue_time = time.time() - queue_start_time
-            run_start_time = time.time()
-            pid = os.getpid()  # Get the PID of the actual processing thread
-            response = task_func()
-            run_time = time.time() - run_start_time
-            total_time = time.time() - queue_start_time
-
-            response_data = {
-                "endpoint": response[1],
-                "code": response[2],
-                "id": data.get("id"),
-                "job_id": job_id,
-                "response": response[0] if response[2] == 200 else None,
-                "message": "success" if response[2] == 200 else response[0],
-                "pid": pid,
-                "queue_id": queue_id,
-                "run_time": round(run_time, 3),
-                "queue_time": round(queue_time, 3),
-                "total_time": round(total_time, 3),
-                "queue_length": task_queue.qsize(),
-                "build_number": BUILD_NUMBER  # Add build number to response
-            }
-
-            send_webhook(data.get("webhook_url"), response_data)
-
-            task_queue.task_done()
-
-    # Start the queue processing in a separate thread
-    threading.Thread(target=process_queue, daemon=True).start()
+            job = None
+            try:
+                job = job_queue.claim_job(job_class)
+                if job is None:
+                    job_added[job_class].wait(job_queue.JOB_QUEUE_POLL_INTERVAL)
+                    job_added[job_class].clear()
+                    continue
+                process_job(job)
+            except Exception as e:
+                # A transient error (e.g. "database is locked" under contention between workers)
+                # must not end this thread, or the worker quietly loses a slot
+                logger.exception(f"Error in {job_class} job slot: {e}")
+                time.sleep(SLOT_ERROR_BACKOFF)
+                if job is not None and not job.get('handed_off'):
+                    fail_job(job, e)
+
+    def process_job(job):
+        job_id = job['job_id']
+        data = job['data']
+        queue_start_time = job['queued_at']
+        task_func = job_queue.get_task(job['task'])
+        queue_time = time.time() - queue_start_time
+        run_start_time = time.time()
+        pid = os.getpid()  # Get the PID of the actual processing thread
+        job_queue.begin_stages()
+        upload_stage.begin_deferred_uploads()
+        response = run_task(task_func, job, job_id, data)
+        job_workspace = workspace.detach_workspace()
+        try:
+            uploads = upload_stage.end_deferred_uploads()
+            stages = job_queue.end_stages()
+
+            if uploads and response[2] == 200:
+                # Free the slot for the next job while the outputs upload; the workspace stays until they're done
+                stages["processing"] = round(time.time() - run_start_time, 3)
+                job_queue.release_job(job_id)
+                upload_stage.submit_uploads(
+                    uploads, job_id,
+                    functools.partial(complete_uploaded_job, job_id, data, response, stages, queue_time, run_start_time, pid, job_workspace)
+                )
+                job_workspace = None
+                job['handed_off'] = True
+                return
+            upload_stage.discard_uploads(uploads)
+            complete_job(job_id, data, response, stages, queue_time, run_start_time, pid)
+            job['handed_off'] = True
+        finally:
+            workspace.close_workspace(job_workspace)
+
+    def fail_job(job, error):
+        # Record the failure so the job doesn't stay 'running' and its webhook still fires
+        try:
+            now = time.time()
+            complete_job(job['job_id'], job['data'], (f"Internal error: {error}", None, 500), {}, now - job['queued_at'], now, os.getpid())
+        except Exception as e:
+            logger.error(f"Could not mark job {job['job_id']} as failed: {e}")
+
+    def complete_uploaded_job(job_id, data, response, stages, queue_time, run_start_time, pid, job_workspace, urls, upload_seconds, error):
+        try:
+            stages = dict(stages, upload=round(upload_seconds, 3))
+            if error is not None:
+                response = f"Upload failed: {error}", response[1], 500
+            else:
+                response = upload_stage.resolve_placeholders(response[0], urls), response[1], response[2]
+            complete_job(job_id, data, response, stages, queue_time, run_start_time, pid)
+        finally:
+            workspace.close_workspace(job_workspace)
+
+    def complete_job(job_id, data, response, stages, queue_time, run_start_time, pid):
+        run_time = time.time() - run_start_time
+        total_time = queue_time + run_time
+
+        response_data = {
+            "endpoint": response[1],
+            "code": response[2],
+            "id": data.get("id"),
+            "job_id": job_id,
+            "response": response[0] if response[2] == 200 else None,
+            "message": "success" if response[2] == 200 else response[0],
+            "pid": pid,
+            "queue_id": queue_id,
+            "run_time": round(run_time, 3),
+            "queue_time": round(queue_time, 3),
+            "total_time": round(total_time, 3),
+            "queue_length": queue_length(),
+            "stage_times": stages,
+            "build_number": BUILD_NUMBER  # Add build number to response
+        }
+
+        subscribers = job_queue.finish_job(job_id, response_data, stages)
+
+        send_webhook(data.get("webhook_url"), response_data)
+        notify_subscribers(subscribers, response_data)
+
+    def notify_subscribers(subscribers, response_data):
+        # Requests that were coalesced into this job get the same result under their own id
+        for subscriber in subscribers:
+            send_webhook(subscriber['webhook_url'], dict(response_data, id=subscriber['client_id'], coalesced=True))
+
+    def run_task(task_func, job, job_id, data):
+        if task_func is None:
+            return f"Unknown task {job['task']}", None, 500
+        try:
+            workspace.open_workspace(job_id)
+            return task_func(job_id=job_id, data=data)
+        except Exception as e:
+            # Views handle their own errors; this keeps the job thread alive if one doesn't
+            return str(e), None, 500
+
+    def reused_result(result, data, pid):
+        # A recent identical job already succeeded; hand back its result under this request's id
+        return dict(
+            result,
+            id=data.get("id"),
+            cached=True,
+            pid=pid,
+            queue_length=queue_length(),
+            build_number=BUILD_NUMBER
+        )
+
+    def too_many_requests(job_id, data, pid, message, retry_after):
+        return {
+            "code": 429,
+            "id": data.get("id"),
+            "job_id": job_id,
+            "message": message,
+            "retry_after": retry_after,
+            "pid": pid,
+            "queue_id": queue_id,
+            "queue_length": queue_length(),
+            "build_number": BUILD_NUMBER  # Add build number to response
+        }, 429, {"Retry-After": str(retry_after)}
 
     # Decorator to add tasks to the queue or bypass it
-    def queue_task(bypass_queue=False):
+    def queue_task(bypass_queue=False, job_class=DEFAULT_JOB_CLASS, coalesce=True):
+        if job_class not in JOB_CLASS_WORKERS:
+            job_class = DEFAULT_JOB_CLASS
+
         def decorator(f):
+            task_name = job_queue.register_task(f)
+
             def wrapper(*args, **kwargs):
                 job_id = str(uuid.uuid4())
                 data = request.json if request.is_json else {}
                 pid = os.getpid()  # Get PID for non-queued tasks
                 start_time = time.time()
-                
-                if bypass_queue or 'webhook_url' not in data:
-                    
-                    response = f(job_id=job_id, data=data, *args, **kwargs)
+
+                request_hash = None
+                if coalesce and COALESCE_REQUESTS and not bypass_queue:
+                    request_hash = job_queue.request_fingerprint(request.path, data)
+                    existing_job_id, result = job_queue.coalesce_job(request_hash, data.get('webhook_url'), data.get('id'), RESULT_CACHE_TTL)
+                    if result is not None:
+                        response_data = reused_result(result, data, pid)
+                        if 'webhook_url' not in data:
+                            response_data.pop("endpoint", None)
+                            return response_data, 200
+                        send_webhook(data['webhook_url'], response_data)
+                        return {
+                            "code": 202,
+                            "id": data.get("id"),
+                            "job_id": existing_job_id,
+                            "message": "processing",
+                            "cached": True,
+                            "pid": pid,
+                            "queue_id": queue_id,
+                            "queue_length": queue_length(),
+                            "build_number": BUILD_NUMBER  # Add build number to response
+                        }, 202
+                    if existing_job_id is not None:
+                        return {
+                            "code": 202,
+                            "id": data.get("id"),
+                            "job_id": existing_job_id,
+                            "message": "processing",
+                            "coalesced": True,
+                            "pid": pid,
+                            "queue_id": queue_id,
+                            "max_queue_length": MAX_QUEUE_LENGTH if MAX_QUEUE_LENGTH > 0 else "unlimited",
+                            "queue_length": queue_length(),
+                            "build_number": BUILD_NUMBER  # Add build number to response
+                        }, 202
+
+                if bypass_queue:
+                    try:
+                        workspace.open_workspace(job_id)
+                        response = f(job_id=job_id, data=data, *args, **kwargs)
+                    finally:
+                        workspace.close_workspace(workspace.detach_workspace())
                     run_time = time.time() - start_time
                     return {
                         "code": response[2],
@@ -74,25 +258,58 @@ def create_app():
                         "total_time": round(run_time, 3),
                         "pid": pid,
                         "queue_id": queue_id,
-                        "queue_length": task_queue.qsize(),
+                        "queue_length": queue_length(),
                         "build_number": BUILD_NUMBER  # Add build number to response
                     }, response[2]
+                elif 'webhook_url' not in data:
+                    job_queue.start_direct_job(job_id, task_name, job_class, data, start_time, request_hash)
+                    job_queue.begin_stages()
+                    try:
+                        workspace.open_workspace(job_id)
+                        response = f(job_id=job_id, data=data, *args, **kwargs)
+                    except Exception as e:
+                        response = str(e), None, 500
+                    finally:
+                        workspace.close_workspace(workspace.detach_workspace())
+                    stages = job_queue.end_stages()
+                    run_time = time.time() - start_time
+                    response_data = {
+                        "endpoint": response[1],
+                        "code": response[2],
+                        "id": data.get("id"),
+                        "job_id": job_id,
+                        "response": response[0] if response[2] == 200 else None,
+                        "message": "success" if response[2] == 200 else response[0],
+                        "run_time": round(run_time, 3),
+                        "queue_time": 0,
+                        "total_time": round(run_time, 3),
+                        "pid": pid,
+                        "queue_id": queue_id,
+                        "queue_length": queue_length(),
+                        "stage_times": stages,
+                        "build_number": BUILD_NUMBER  # Add build number to response
+                    }
+                    notify_subscribers(job_queue.finish_job(job_id, response_data, stages), response_data)
+                    del response_data["endpoint"]
+                    return response_data, response[2]
                 else:
-                    if MAX_QUEUE_LENGTH > 0 and task_queue.qsize() >= MAX_QUEUE_LENGTH:
-                        return {
-                            "code": 429,
-                            "id": data.get("id"),
-                            "job_id": job_id,
-                            "message": f"MAX_QUEUE_LENGTH ({MAX_QUEUE_LENGTH}) reached",
-                            "pid": pid,
-                            "queue_id": queue_id,
-                            "queue_length": task_queue.qsize(),
-                            "build_number": BUILD_NUMBER  # Add build number to response
-                        }, 429
-                    
-                    task_queue.put((job_id, data, lambda: f(job_id=job_id, data=data, *args, **kwargs), start_time))
+                    slots = JOB_CLASS_WORKERS[job_class] * WORKER_PROCESSES
+                    cost = None
+                    if ADMISSION_CONTROL or job_queue.SCHEDULER_POLICY == 'sjf':
+                        cost = estimate_job_cost(request.path, job_class, data)
+                    if ADMISSION_CONTROL:
+                        class_slots = {name: max(workers, 1) * WORKER_PROCESSES for name, workers in JOB_CLASS_WORKERS.items()}
+                        admitted, reason, retry_after = check_admission(job_class, cost, class_slots)
+                        if not admitted:
+                            return too_many_requests(job_id, data, pid, reason, retry_after)
+
+                    if not job_queue.enqueue_job(job_id, task_name, job_class, data, start_time, MAX_QUEUE_LENGTH, cost, request_hash):
+                        retry_after = max(1, int(projected_drain_time(job_class, slots)))
+                        return too_many_requests(job_id, data, pid, f"MAX_QUEUE_LENGTH ({MAX_QUEUE_LENGTH}) reached", retry_after)
                     
-                    return {
+                    job_added[job_class].set()
+
+                    response_data = {
                         "code": 202,
                         "id": data.get("id"),
                         "job_id": job_id,
@@ -100,9 +317,15 @@ def create_app():
                         "pid": pid,
                         "queue_id": queue_id,
                         "max_queue_length": MAX_QUEUE_LENGTH if MAX_QUEUE_LENGTH > 0 else "unlimited",
-                        "queue_length": task_queue.qsize(),
+                        "queue_length": queue_length(),
                         "build_number": BUILD_NUMBER  # Add build number to response
-                    }, 202
+                    }
+                    if cost:
+                        estimated_start, estimated_completion = estimate_schedule(job_id, job_class, slots, cost['seconds'], start_time)
+                        response_data["estimated_run_time"] = cost['seconds']
+                        response_data["estimated_start"] = estimated_start
+                        response_data["estimated_completion"] = estimated_completion
+                    return response_data, 202
             return wrapper
         return decorator
 
@@ -142,6 +365,10 @@ def create_app():
     from routes.v1.image.transform.image_to_video import v1_image_transform_video_bp, v1_image_transform_video_2segments_bp
     from routes.v1.toolkit.test import v1_toolkit_test_bp
     from routes.v1.toolkit.authenticate import v1_toolkit_auth_bp
+    from routes.v1.toolkit.jobs import v1_toolkit_jobs_bp
+    from routes.v1.toolkit.webhooks import v1_toolkit_webhooks_bp
+    from routes.v1.toolkit.storage import v1_toolkit_storage_bp
+    from routes.v1.toolkit.models import v1_toolkit_models_bp
     from routes.v1.code.execute.execute_python import v1_code_execute_bp
 
     app.register_blueprint(v1_ffmpeg_compose_bp)
@@ -153,8 +380,20 @@ def create_app():
     app.register_blueprint(v1_image_transform_video_2segments_bp)
     app.register_blueprint(v1_toolkit_test_bp)
     app.register_blueprint(v1_toolkit_auth_bp)
+    app.register_blueprint(v1_toolkit_jobs_bp)
+    app.register_blueprint(v1_toolkit_webhooks_bp)
+    app.register_blueprint(v1_toolkit_storage_bp)
+    app.register_blueprint(v1_toolkit_models_bp)
     app.register_blueprint(v1_code_execute_bp)
 
+    # Start the configured number of processing threads for each job class. Tasks are registered
+    # when their route modules are imported, so jobs interrupted by a restart are only re-enqueued,
+    # and claimed, once every blueprint is in.
+    job_queue.recover_jobs()
+    for job_class, workers in JOB_CLASS_WORKERS.items():
+        for _ in range(max(workers, 1)):
+            threading.Thread(target=process_queue, args=(job_class,), daemon=True).start()
+
     return app
 
 app = create_app()
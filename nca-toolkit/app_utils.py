@@ -1,6 +1,7 @@
 from flask import request, jsonify, current_app
 from functools import wraps
 import jsonschema
+from services.job_queue import register_task
 
 def validate_payload(schema):
     def decorator(f):
@@ -17,9 +18,12 @@ def validate_payload(schema):
         return decorated_function
     return decorator
 
-def queue_task_wrapper(bypass_queue=False):
+def queue_task_wrapper(bypass_queue=False, job_class='ffmpeg', coalesce=True):
     def decorator(f):
+        # Register at import time so every worker can run jobs queued by the others
+        register_task(f)
+
         def wrapper(*args, **kwargs):
-            return current_app.queue_task(bypass_queue=bypass_queue)(f)(*args, **kwargs)
+            return current_app.queue_task(bypass_queue=bypass_queue, job_class=job_class, coalesce=coalesce)(f)(*args, **kwargs)
         return wrapper
     return decorator
\ No newline at end of file
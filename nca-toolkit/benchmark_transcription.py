@@ -0,0 +1,125 @@
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+from pathlib import Path
+from services.transcription_backends import BACKENDS, get_backend
+
+MEDIA_EXTENSIONS = {'.mp3', '.wav', '.m4a', '.flac', '.ogg', '.mp4', '.mkv', '.webm', '.mov'}
+
+def load_fixtures(fixtures_dir):
+    """Media files of a fixture directory, each with a reference transcript in a .txt file of the same name."""
+    fixtures = []
+    for media_path in sorted(Path(fixtures_dir).iterdir()):
+        if media_path.suffix.lower() not in MEDIA_EXTENSIONS:
+            continue
+        reference_path = media_path.with_suffix('.txt')
+        if not reference_path.exists():
+            print(f"Skipping {media_path.name}: no reference transcript at {reference_path.name}")
+            continue
+        fixtures.append((media_path, reference_path.read_text(encoding='utf-8')))
+    return fixtures
+
+def media_duration(path):
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', str(path)],
+        capture_output=True, text=True
+    )
+    return float(result.stdout.strip() or 0)
+
+def normalize(text):
+    """Lowercase words without punctuation, so WER only counts recognition errors."""
+    return re.sub(r"[^\w\s']", ' ', text.lower()).split()
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance divided by the number of reference words."""
+    ref = normalize(reference)
+    hyp = normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / max(len(ref), 1)
+
+def benchmark_backend(backend_name, model_size, fixtures, language):
+    """Load the model once, transcribe every fixture and return per-file and total results."""
+    _, backend = get_backend(backend_name)
+    start = time.time()
+    model = backend.load(model_size)
+    load_seconds = time.time() - start
+
+    files = []
+    for media_path, reference in fixtures:
+        options = {'language': language} if language else {}
+        start = time.time()
+        result = backend.transcribe(model, str(media_path), **options)
+        seconds = time.time() - start
+        duration = media_duration(media_path)
+        files.append({
+            'file': media_path.name,
+            'duration': round(duration, 2),
+            'seconds': round(seconds, 2),
+            'real_time_factor': round(seconds / duration, 3) if duration else None,
+            'wer': round(word_error_rate(reference, result['text']), 4),
+        })
+
+    total_duration = sum(f['duration'] for f in files)
+    total_seconds = sum(f['seconds'] for f in files)
+    reference_words = [len(normalize(reference)) for _, reference in fixtures]
+    # Corpus WER weights each file by its number of reference words
+    corpus_wer = sum(f['wer'] * words for f, words in zip(files, reference_words)) / max(sum(reference_words), 1)
+    return {
+        'backend': backend_name,
+        'model_size': model_size,
+        'load_seconds': round(load_seconds, 2),
+        'media_seconds': round(total_duration, 2),
+        'transcribe_seconds': round(total_seconds, 2),
+        'real_time_factor': round(total_seconds / total_duration, 3) if total_duration else None,
+        'wer': round(corpus_wer, 4),
+        'files': files,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare transcription backends on speed and word error rate.")
+    parser.add_argument('fixtures', help="Directory of media files, each with a reference transcript in <name>.txt")
+    parser.add_argument('--backends', default=','.join(BACKENDS), help="Comma-separated backends to compare")
+    parser.add_argument('--model-size', default='base', help="Whisper model size (default: base)")
+    parser.add_argument('--language', help="Language of the fixtures, detected when omitted")
+    parser.add_argument('--output', help="Write the full results to this JSON file")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"Error: No fixtures with reference transcripts found in {args.fixtures}")
+        sys.exit(1)
+
+    results = []
+    for backend_name in [name.strip() for name in args.backends.split(',') if name.strip()]:
+        print(f"Benchmarking {backend_name} ({args.model_size}) on {len(fixtures)} files...")
+        try:
+            results.append(benchmark_backend(backend_name, args.model_size, fixtures, args.language))
+        except Exception as e:
+            print(f"Error: {backend_name} failed: {e}")
+
+    print(f"\n{'backend':<16}{'load s':>8}{'media s':>10}{'run s':>10}{'RTF':>8}{'WER':>8}")
+    for result in results:
+        print(
+            f"{result['backend']:<16}{result['load_seconds']:>8}{result['media_seconds']:>10}"
+            f"{result['transcribe_seconds']:>10}{result['real_time_factor']:>8}{result['wer']:>8.2%}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
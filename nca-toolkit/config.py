@@ -18,7 +18,8 @@ def validate_env_vars(provider):
     """ Validate the necessary environment variables for the selected storage provider """
     required_vars = {
         'GCP': ['GCP_BUCKET_NAME', 'GCP_SA_CREDENTIALS'],
-        'S3': ['S3_ENDPOINT_URL', 'S3_ACCESS_KEY', 'S3_SECRET_KEY']
+        'S3': ['S3_ENDPOINT_URL', 'S3_ACCESS_KEY', 'S3_SECRET_KEY'],
+        'LOCAL': ['LOCAL_STORAGE_BASE_URL']
     }
     
     missing_vars = [var for var in required_vars[provider] if not os.getenv(var)]
@@ -3,7 +3,7 @@ from app_utils import *
 import logging
 from services.audio_mixing import process_audio_mixing
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 
 audio_mixing_bp = Blueprint('audio_mixing', __name__)
 logger = logging.getLogger(__name__)
@@ -42,10 +42,10 @@ def audio_mixing(job_id, data):
             video_url, audio_url, video_vol, audio_vol, output_length, job_id, webhook_url
         )
 
-        # Upload the mixed file using the unified upload_file() method
-        cloud_url = upload_file(output_filename)
+        # Upload the mixed file once processing is done
+        cloud_url = upload_later(output_filename)
 
-        logger.info(f"Job {job_id}: Mixed media uploaded to cloud storage: {cloud_url}")
+        logger.info(f"Job {job_id}: Mixed media queued for upload to cloud storage")
 
         # Return the cloud URL for the uploaded file
         return cloud_url, "/audio-mixing", 200
@@ -3,7 +3,7 @@ from app_utils import *
 import logging
 from services.caption_video import process_captioning
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 import os
 
 caption_bp = Blueprint('caption', __name__)
@@ -61,10 +61,10 @@ def caption_video(job_id, data):
         output_filename = process_captioning(video_url, captions, caption_type, options, job_id)
         logger.info(f"Job {job_id}: Captioning process completed successfully")
 
-        # Upload the captioned video using the unified upload_file() method
-        cloud_url = upload_file(output_filename)
+        # Upload the captioned video once processing is done
+        cloud_url = upload_later(output_filename)
 
-        logger.info(f"Job {job_id}: Captioned video uploaded to cloud storage: {cloud_url}")
+        logger.info(f"Job {job_id}: Captioned video queued for upload to cloud storage")
 
         # Return the cloud URL for the uploaded file
         return cloud_url, "/caption-video", 200
@@ -1,9 +1,10 @@
 from flask import Blueprint
 from app_utils import *
 import logging
+import functools
 from services.extract_keyframes import process_keyframe_extraction
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_batch_later
 
 extract_keyframes_bp = Blueprint('extract_keyframes', __name__)
 logger = logging.getLogger(__name__)
@@ -15,7 +16,8 @@ logger = logging.getLogger(__name__)
     "properties": {
         "video_url": {"type": "string", "format": "uri"},
         "webhook_url": {"type": "string", "format": "uri"},
-        "id": {"type": "string"}
+        "id": {"type": "string"},
+        "stream": {"type": "boolean"}
     },
     "required": ["video_url"],
     "additionalProperties": False
@@ -25,24 +27,30 @@ def extract_keyframes(job_id, data):
     video_url = data.get('video_url')
     webhook_url = data.get('webhook_url')
     id = data.get('id')
+    stream = data.get('stream', False)
 
     logger.info(f"Job {job_id}: Received keyframe extraction request for {video_url}")
 
     try:
         # Process keyframe extraction
-        image_paths = process_keyframe_extraction(video_url, job_id)
+        image_paths = process_keyframe_extraction(video_url, job_id, stream)
 
-        # Upload each extracted keyframe and collect the cloud URLs
-        image_urls = []
-        for image_path in image_paths:
-            cloud_url = upload_file(image_path)
-            image_urls.append({"image_url": cloud_url})
-
-        logger.info(f"Job {job_id}: Keyframes uploaded to cloud storage")
-
-        # Return the URLs of the uploaded keyframes
-        return {"image_urls": image_urls}, "/extract-keyframes", 200
+        # Upload the extracted keyframes concurrently once the job's slot is free, keeping their order.
+        # Keyframes of a video seen before are identical, so they are named by content and not re-sent.
+        response = upload_batch_later(image_paths, functools.partial(keyframes_response, job_id))
+        return response, "/extract-keyframes", 200
         
     except Exception as e:
         logger.error(f"Job {job_id}: Error during keyframe extraction - {str(e)}")
         return str(e), "/extract-keyframes", 500
+
+def keyframes_response(job_id, cloud_urls, failures):
+    """URLs of the uploaded keyframes; failed ones have a null URL and are listed in failed_uploads."""
+    if cloud_urls and len(failures) == len(cloud_urls):
+        raise Exception(f"All {len(cloud_urls)} keyframe uploads failed: {failures[0]['error']}")
+    logger.info(f"Job {job_id}: {len(cloud_urls) - len(failures)} of {len(cloud_urls)} keyframes uploaded to cloud storage")
+
+    response = {"image_urls": [{"image_url": cloud_url} for cloud_url in cloud_urls]}
+    if failures:
+        response["failed_uploads"] = failures
+    return response
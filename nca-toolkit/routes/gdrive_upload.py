@@ -157,7 +157,7 @@ def upload_file_in_chunks(file_url, upload_url, total_size, job_id, chunk_size):
     "required": ["file_url", "filename", "folder_id"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, job_class='io', coalesce=False)
 def gdrive_upload(job_id, data):
     logger.info(f"Processing Job ID: {job_id}")
 
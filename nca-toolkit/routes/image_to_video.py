@@ -3,7 +3,7 @@ from app_utils import *
 import logging
 from services.image_to_video import process_image_to_video
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 
 image_to_video_bp = Blueprint('image_to_video', __name__)
 logger = logging.getLogger(__name__)
@@ -40,11 +40,10 @@ def image_to_video(job_id, data):
             image_url, length, frame_rate, zoom_speed, job_id, webhook_url
         )
 
-        # Upload the resulting file using the unified upload_file() method
-        cloud_url = upload_file(output_filename)
+        # Upload the resulting file once processing is done
+        cloud_url = upload_later(output_filename)
 
-        # Log the successful upload
-        logger.info(f"Job {job_id}: Converted video uploaded to cloud storage: {cloud_url}")
+        logger.info(f"Job {job_id}: Converted video queued for upload to cloud storage")
 
         # Return the cloud URL for the uploaded file
         return cloud_url, "/image-to-video", 200
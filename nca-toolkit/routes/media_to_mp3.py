@@ -4,7 +4,7 @@ from app_utils import *
 import logging
 from services.ffmpeg_toolkit import process_conversion
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 import os
 
 convert_bp = Blueprint('convert', __name__)
@@ -36,8 +36,8 @@ def convert_media_to_mp3(job_id, data):
         output_file = process_conversion(media_url, job_id, bitrate)
         logger.info(f"Job {job_id}: Media conversion process completed successfully")
 
-        cloud_url = upload_file(output_file)
-        logger.info(f"Job {job_id}: Converted media uploaded to cloud storage: {cloud_url}")
+        cloud_url = upload_later(output_file)
+        logger.info(f"Job {job_id}: Converted media queued for upload to cloud storage")
 
         return cloud_url, "/media-to-mp3", 200
 
@@ -1,10 +1,9 @@
 from flask import Blueprint
 from app_utils import *
 import logging
-import os
 from services.transcription import process_transcription
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 
 transcribe_bp = Blueprint('transcribe', __name__)
 logger = logging.getLogger(__name__)
@@ -23,7 +22,7 @@ logger = logging.getLogger(__name__)
     "required": ["media_url"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, job_class='whisper')
 def transcribe(job_id, data):
     media_url = data['media_url']
     output = data.get('output', 'transcript')
@@ -37,10 +36,10 @@ def transcribe(job_id, data):
         result = process_transcription(media_url, output, max_chars)
         logger.info(f"Job {job_id}: Transcription process completed successfully")
 
-        # If the result is a file path, upload it using the unified upload_file() method
+        # If the result is a file path, upload it once transcription is done
         if output in ['srt', 'vtt', 'ass']:
-            cloud_url = upload_file(result)
-            os.remove(result)  # Remove the temporary file after uploading
+            # Remove the temporary file after uploading; repeated transcripts are stored once
+            cloud_url = upload_later(result, remove=True)
             return cloud_url, "/transcribe-media", 200
         else:
             return result, "/transcribe-media", 200
@@ -24,7 +24,7 @@ logger = logging.getLogger(__name__)
     "required": ["code"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, coalesce=False)
 def execute_python(job_id, data):
     logger.info(f"Job {job_id}: Received Python code execution request")
     
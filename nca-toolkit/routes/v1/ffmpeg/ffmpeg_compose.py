@@ -4,7 +4,7 @@ from flask import Blueprint, request, jsonify
 from app_utils import *
 from services.v1.ffmpeg.ffmpeg_compose import process_ffmpeg_compose
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 
 v1_ffmpeg_compose_bp = Blueprint('v1_ffmpeg_compose', __name__)
 logger = logging.getLogger(__name__)
@@ -20,6 +20,7 @@ logger = logging.getLogger(__name__)
                 "type": "object",
                 "properties": {
                     "file_url": {"type": "string", "format": "uri"},
+                    "stream": {"type": "boolean"},
                     "options": {
                         "type": "array",
                         "items": {
@@ -103,11 +104,13 @@ def ffmpeg_api(job_id, data):
     try:
         output_filenames, metadata = process_ffmpeg_compose(data, job_id)
         
-        # Upload output files to GCP and create result array
+        # Upload output files to cloud storage once processing is done and create result array
         output_urls = []
         for i, output_filename in enumerate(output_filenames):
             if os.path.exists(output_filename):
-                upload_url = upload_file(output_filename)
+                # Local output is removed after upload; outputs with a requested filename keep it
+                custom_name = bool(data["outputs"][i].get("filename"))
+                upload_url = upload_later(output_filename, remove=True, content_addressed=False if custom_name else None)
                 output_info = {"file_url": upload_url}
                 
                 if metadata and i < len(metadata):
@@ -115,14 +118,12 @@ def ffmpeg_api(job_id, data):
                     if 'thumbnail' in output_metadata:
                         thumbnail_path = output_metadata['thumbnail']
                         if os.path.exists(thumbnail_path):
-                            thumbnail_url = upload_file(thumbnail_path)
+                            thumbnail_url = upload_later(thumbnail_path, remove=True)
                             del output_metadata['thumbnail']
                             output_metadata['thumbnail_url'] = thumbnail_url
-                            os.remove(thumbnail_path)  # Clean up local thumbnail file
                     output_info.update(output_metadata)
                 
                 output_urls.append(output_info)
-                os.remove(output_filename)  # Clean up local output file after upload
             else:
                 raise Exception(f"Expected output file {output_filename} not found")
 
@@ -3,7 +3,7 @@ from app_utils import *
 import logging
 from services.v1.image.transform.image_to_video import process_image_to_video, process_image_to_video_2segments
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 
 v1_image_transform_video_bp = Blueprint('v1_image_transform_video', __name__)
 v1_image_transform_video_2segments_bp = Blueprint('v1_image_transform_video_2segments', __name__)
@@ -45,11 +45,10 @@ def image_to_video(job_id, data):
             image_url, length, frame_rate, zoom_speed, zoom_x, zoom_y, filename, webhook_url
         )
 
-        # Upload the resulting file using the unified upload_file() method
-        cloud_url = upload_file(output_filename)
+        # Upload the resulting file once processing is done
+        cloud_url = upload_later(output_filename)
 
-        # Log the successful upload
-        logger.info(f"Job {job_id}: Converted video uploaded to cloud storage: {cloud_url}")
+        logger.info(f"Job {job_id}: Converted video queued for upload to cloud storage")
 
         # Return the cloud URL for the uploaded file
         return cloud_url, "/v1/image/transform/video", 200
@@ -95,11 +94,10 @@ def image_to_video_2segments(job_id, data):
             image_url, length, frame_rate, zoom_speed, zoom_x, zoom_y, filename, webhook_url
         )
 
-        # Upload the resulting file using the unified upload_file() method
-        cloud_url = upload_file(output_filename)
+        # Upload the resulting file once processing is done
+        cloud_url = upload_later(output_filename)
 
-        # Log the successful upload
-        logger.info(f"Job {job_id}: Converted 2-segment video uploaded to cloud storage: {cloud_url}")
+        logger.info(f"Job {job_id}: Converted 2-segment video queued for upload to cloud storage")
 
         # Return the cloud URL for the uploaded file
         return cloud_url, "/v1/image/transform/video2segments", 200
@@ -1,10 +1,10 @@
 from flask import Blueprint
 from app_utils import *
 import logging
-import os
 from services.v1.media.media_transcribe import process_transcribe_media
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
+from services.transcription_backends import BACKENDS
 
 v1_media_transcribe_bp = Blueprint('v1_media_transcribe', __name__)
 logger = logging.getLogger(__name__)
@@ -24,12 +24,14 @@ logger = logging.getLogger(__name__)
         "language": {"type": "string"},
         "webhook_url": {"type": "string", "format": "uri"},
         "id": {"type": "string"},
-        "model_size": {"type": "string", "enum": ["base", "small", "medium", "large"]}
+        "model_size": {"type": "string", "enum": ["base", "small", "medium", "large"]},
+        "backend": {"type": "string", "enum": list(BACKENDS)},
+        "long_media": {"type": "boolean"}
     },
     "required": ["media_url"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, job_class='whisper')
 def transcribe(job_id, data):
     media_url = data['media_url']
     task = data.get('task', 'transcribe')
@@ -42,15 +44,17 @@ def transcribe(job_id, data):
     webhook_url = data.get('webhook_url')
     id = data.get('id')
     model_size = data.get('model_size', 'medium')
+    backend = data.get('backend')
+    long_media = data.get('long_media', False)
 
     logger.info(f"Job {job_id}: Received transcription request for {media_url} using model size {model_size}")
 
     try:
         result = process_transcribe_media(media_url, task, include_text, include_srt, include_segments, 
-                                         word_timestamps, response_type, language, job_id, model_size)
+                                         word_timestamps, response_type, language, job_id, model_size, backend, long_media)
         logger.info(f"Job {job_id}: Transcription process completed successfully")
 
-        # If the result is a file path, upload it using the unified upload_file() method
+        # If the result is a file path, upload it once transcription is done
         if response_type == "direct":
            
             result_json = {
@@ -60,6 +64,7 @@ def transcribe(job_id, data):
                 "text_url": None,
                 "srt_url": None,
                 "segments_url": None,
+                "backend": result[3],
             }
 
             return result_json, "/v1/transcribe/media", 200
@@ -70,20 +75,13 @@ def transcribe(job_id, data):
                 "text": None,
                 "srt": None,
                 "segments": None,
-                "text_url": upload_file(result[0]) if include_text is True else None,
-                "srt_url": upload_file(result[1]) if include_srt is True else None,
-                "segments_url": upload_file(result[2]) if include_segments is True else None,
+                # Temporary files are removed after uploading; repeated transcripts are stored once
+                "text_url": upload_later(result[0], remove=True) if include_text is True else None,
+                "srt_url": upload_later(result[1], remove=True) if include_srt is True else None,
+                "segments_url": upload_later(result[2], remove=True) if include_segments is True else None,
+                "backend": result[3],
             }
 
-            if include_text is True:
-                os.remove(result[0])  # Remove the temporary file after uploading
-            
-            if include_srt is True:
-                os.remove(result[1])
-
-            if include_segments is True:
-                os.remove(result[2])
-            
             return cloud_urls, "/v1/transcribe/media", 200
 
     except Exception as e:
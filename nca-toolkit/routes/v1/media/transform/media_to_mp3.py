@@ -2,9 +2,9 @@
 from flask import Blueprint, current_app
 from app_utils import *
 import logging
-from services.v1.media.transform.media_to_mp3 import process_media_to_mp3
+from services.v1.media.transform.media_to_mp3 import process_media_to_mp3, process_media_to_mp3_pipeline
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 import os
 
 v1_media_transform_mp3_bp = Blueprint('v1_media_transform', __name__)
@@ -18,7 +18,8 @@ logger = logging.getLogger(__name__)
         "media_url": {"type": "string", "format": "uri"},
         "webhook_url": {"type": "string", "format": "uri"},
         "id": {"type": "string"},
-        "bitrate": {"type": "string", "pattern": "^[0-9]+k$"}
+        "bitrate": {"type": "string", "pattern": "^[0-9]+k$"},
+        "stream": {"type": "boolean"}
     },
     "required": ["media_url"],
     "additionalProperties": False
@@ -29,15 +30,22 @@ def convert_media_to_mp3(job_id, data):
     webhook_url = data.get('webhook_url')
     id = data.get('id')
     bitrate = data.get('bitrate', '128k')
+    stream = data.get('stream', False)
 
     logger.info(f"Job {job_id}: Received media-to-mp3 request for media URL: {media_url}")
 
     try:
+        if stream:
+            # Download, conversion and upload overlap; no local files
+            cloud_url = process_media_to_mp3_pipeline(media_url, job_id, bitrate)
+            logger.info(f"Job {job_id}: Media converted and uploaded to cloud storage: {cloud_url}")
+            return cloud_url, "/v1/media/transform/mp3", 200
+
         output_file = process_media_to_mp3(media_url, job_id, bitrate)
         logger.info(f"Job {job_id}: Media conversion process completed successfully")
 
-        cloud_url = upload_file(output_file)
-        logger.info(f"Job {job_id}: Converted media uploaded to cloud storage: {cloud_url}")
+        cloud_url = upload_later(output_file)
+        logger.info(f"Job {job_id}: Converted media queued for upload to cloud storage")
 
         return cloud_url, "/v1/media/transform/mp3", 200
 
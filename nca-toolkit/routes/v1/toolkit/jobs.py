@@ -0,0 +1,33 @@
+import logging
+from flask import Blueprint, request, jsonify
+from services.authentication import authenticate
+from services import job_queue
+
+v1_toolkit_jobs_bp = Blueprint('v1_toolkit_jobs', __name__)
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ['queued', 'running', 'done', 'failed']
+MAX_JOBS_PER_PAGE = 500
+
+@v1_toolkit_jobs_bp.route('/v1/toolkit/jobs/<job_id>', methods=['GET'])
+@authenticate
+def get_job_status(job_id):
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return jsonify({"message": f"Job {job_id} not found"}), 404
+    return jsonify(job), 200
+
+@v1_toolkit_jobs_bp.route('/v1/toolkit/jobs', methods=['GET'])
+@authenticate
+def list_job_statuses():
+    """List jobs, optionally filtered by ?job_ids=a,b,c, ?status=, ?since=<unix time> and ?limit=."""
+    job_ids = [job_id for job_id in request.args.get('job_ids', '').split(',') if job_id]
+    status = request.args.get('status')
+    if status and status not in JOB_STATUSES:
+        return jsonify({"message": f"Invalid status. Must be one of: {', '.join(JOB_STATUSES)}"}), 400
+
+    since = request.args.get('since', type=float)
+    limit = max(1, min(request.args.get('limit', 100, type=int), MAX_JOBS_PER_PAGE))
+
+    jobs = job_queue.list_jobs(job_ids=job_ids, status=status, since=since, limit=limit)
+    return jsonify({"jobs": jobs, "count": len(jobs)}), 200
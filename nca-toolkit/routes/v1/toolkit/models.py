@@ -0,0 +1,12 @@
+from flask import Blueprint, jsonify
+from services.authentication import authenticate
+from services.whisper_models import model_status
+
+v1_toolkit_models_bp = Blueprint('v1_toolkit_models', __name__)
+
+@v1_toolkit_models_bp.route('/v1/toolkit/models', methods=['GET'])
+@authenticate
+def whisper_models():
+    """Whisper models loaded by this worker; 503 until the models in WHISPER_PRELOAD_MODELS are loaded."""
+    status = model_status()
+    return jsonify(status), 200 if status["ready"] else 503
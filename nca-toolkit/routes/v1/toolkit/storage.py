@@ -0,0 +1,10 @@
+from flask import Blueprint, jsonify
+from services.authentication import authenticate
+from services.cloud_storage import get_upload_metrics
+
+v1_toolkit_storage_bp = Blueprint('v1_toolkit_storage', __name__)
+
+@v1_toolkit_storage_bp.route('/v1/toolkit/storage', methods=['GET'])
+@authenticate
+def storage_metrics():
+    return jsonify(get_upload_metrics()), 200
@@ -4,21 +4,20 @@ from flask import Blueprint
 from services.authentication import authenticate
 from services.cloud_storage import upload_file
 from app_utils import queue_task_wrapper
+from services.workspace import workspace_dir
 
 v1_toolkit_test_bp = Blueprint('v1_toolkit_test', __name__)
 logger = logging.getLogger(__name__)
 
-STORAGE_PATH = "/tmp/"
-
 @v1_toolkit_test_bp.route('/v1/toolkit/test', methods=['GET'])
 @authenticate
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, job_class='io', coalesce=False)
 def test_api(job_id, data):
     logger.info(f"Job {job_id}: Testing NCA Toolkit API setup")
     
     try:
         # Create test file
-        test_filename = os.path.join(STORAGE_PATH, "success.txt")
+        test_filename = os.path.join(workspace_dir(), "success.txt")
         with open(test_filename, 'w') as f:
             f.write("You have successfully installed the NCA Toolkit API, great job!")
         
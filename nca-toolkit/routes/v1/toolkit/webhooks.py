@@ -0,0 +1,14 @@
+from flask import Blueprint, request, jsonify
+from services.authentication import authenticate
+from services.webhook import get_webhook_metrics, list_failed_deliveries
+
+v1_toolkit_webhooks_bp = Blueprint('v1_toolkit_webhooks', __name__)
+
+@v1_toolkit_webhooks_bp.route('/v1/toolkit/webhooks', methods=['GET'])
+@authenticate
+def webhook_metrics():
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    return jsonify({
+        "metrics": get_webhook_metrics(),
+        "failed_deliveries": list_failed_deliveries(limit)
+    }), 200
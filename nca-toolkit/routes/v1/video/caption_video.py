@@ -3,8 +3,7 @@ from app_utils import validate_payload, queue_task_wrapper
 import logging
 from services.v1.video.caption_video import process_captioning_v1
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
-import os
+from services.upload_stage import upload_later
 import requests  # Ensure requests is imported for webhook handling
 
 v1_video_caption_bp = Blueprint('v1_video/caption', __name__)
@@ -76,7 +75,7 @@ logger = logging.getLogger(__name__)
     "required": ["video_url"],
     "additionalProperties": False
 })
-@queue_task_wrapper(bypass_queue=False)
+@queue_task_wrapper(bypass_queue=False, job_class='whisper')
 def caption_video_v1(job_id, data):
     video_url = data['video_url']
     captions = data.get('captions')
@@ -111,13 +110,9 @@ def caption_video_v1(job_id, data):
         output_path = output
         logger.info(f"Job {job_id}: Captioning process completed successfully")
 
-        # Upload the captioned video
-        cloud_url = upload_file(output_path)
-        logger.info(f"Job {job_id}: Captioned video uploaded to cloud storage: {cloud_url}")
-
-        # Clean up the output file after upload
-        os.remove(output_path)
-        logger.info(f"Job {job_id}: Cleaned up local output file")
+        # Upload the captioned video, then clean up the output file
+        cloud_url = upload_later(output_path, remove=True)
+        logger.info(f"Job {job_id}: Captioned video queued for upload to cloud storage")
 
         return cloud_url, "/v1/video/caption", 200
 
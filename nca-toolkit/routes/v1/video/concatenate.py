@@ -3,7 +3,7 @@ from app_utils import *
 import logging
 from services.v1.video.concatenate import process_video_concatenate
 from services.authentication import authenticate
-from services.cloud_storage import upload_file
+from services.upload_stage import upload_later
 
 v1_video_concatenate_bp = Blueprint('v1_video_concatenate', __name__)
 logger = logging.getLogger(__name__)
@@ -42,8 +42,8 @@ def combine_videos(job_id, data):
         output_file = process_video_concatenate(media_urls, job_id)
         logger.info(f"Job {job_id}: Video combination process completed successfully")
 
-        cloud_url = upload_file(output_file)
-        logger.info(f"Job {job_id}: Combined video uploaded to cloud storage: {cloud_url}")
+        cloud_url = upload_later(output_file)
+        logger.info(f"Job {job_id}: Combined video queued for upload to cloud storage")
 
         return cloud_url, "/v1/video/concatenate", 200
 
@@ -0,0 +1,246 @@
+import os
+import json
+import math
+import time
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import psutil
+from services.job_queue import active_jobs
+from services.workspace import WORKSPACE_ROOT, directory_usage
+from services.runtime_model import predict_run_time
+from services.transcription_backends import TRANSCRIBE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Set to 'false' to only enforce MAX_QUEUE_LENGTH
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'true').lower() == 'true'
+
+# Scratch filesystem that downloads and outputs are written to
+ADMISSION_DISK_PATH = os.environ.get('ADMISSION_DISK_PATH', '/tmp')
+
+# Headroom kept free when admitting jobs
+ADMISSION_MEMORY_RESERVE = float(os.environ.get('ADMISSION_MEMORY_RESERVE_GB', 0.5)) * GB
+ADMISSION_DISK_RESERVE = float(os.environ.get('ADMISSION_DISK_RESERVE_GB', 1)) * GB
+
+# Reject when the box is this busy and jobs are already waiting
+ADMISSION_MAX_CPU = float(os.environ.get('ADMISSION_MAX_CPU', 95))
+
+# Reject when the estimated time to drain a job class exceeds this many seconds (0 = no limit)
+ADMISSION_MAX_BACKLOG = float(os.environ.get('ADMISSION_MAX_BACKLOG', 0))
+
+# Seconds to spend probing input media, and how many inputs to probe per request
+ADMISSION_PROBE_TIMEOUT = float(os.environ.get('ADMISSION_PROBE_TIMEOUT', 5))
+ADMISSION_MAX_PROBES = int(os.environ.get('ADMISSION_MAX_PROBES', 5))
+
+# Media duration assumed when an input can't be probed
+DEFAULT_MEDIA_DURATION = 300
+
+# Processing seconds per second of media and peak RAM for each Whisper model on CPU
+WHISPER_MODEL_COSTS = {
+    'tiny': (0.05, 0.4 * GB),
+    'base': (0.1, 0.6 * GB),
+    'small': (0.3, 1.2 * GB),
+    'medium': (0.8, 3 * GB),
+    'large': (1.6, 6 * GB),
+}
+
+# Model each transcription endpoint uses when the request doesn't pick one
+DEFAULT_WHISPER_MODELS = {
+    '/v1/media/transcribe': 'medium',
+}
+
+# Processing seconds per second of 1080p media, and peak RAM, for an FFmpeg encode
+FFMPEG_SECONDS_PER_MEDIA_SECOND = 0.5
+FFMPEG_MEMORY = 0.5 * GB
+
+# Fixed per-job overhead and transfer rate assumed for I/O-only jobs
+JOB_OVERHEAD_SECONDS = 2
+IO_BYTES_PER_SECOND = 20 * 1024 * 1024
+
+def find_media_urls(data):
+    """Return every input media URL in a request payload, in order."""
+    urls = []
+    for key in ('media_url', 'video_url', 'audio_url', 'image_url', 'file_url'):
+        if data.get(key):
+            urls.append(data[key])
+    for item in data.get('video_urls', []):
+        urls.append(item.get('video_url'))
+    for item in data.get('inputs', []):
+        urls.append(item.get('file_url'))
+    return [url for url in urls if url]
+
+def probe_media(url):
+    """Duration, size and video resolution of a media URL, read by ffprobe without downloading it."""
+    cmd = [
+        'ffprobe', '-v', 'error', '-print_format', 'json',
+        '-show_entries', 'format=duration,size:stream=codec_type,width,height',
+        url
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=ADMISSION_PROBE_TIMEOUT)
+        probe = json.loads(result.stdout or '{}')
+    except (subprocess.TimeoutExpired, OSError, ValueError) as e:
+        logger.warning(f"Could not probe {url}: {e}")
+        return {}
+
+    info = {}
+    fmt = probe.get('format', {})
+    if fmt.get('duration') not in (None, 'N/A'):
+        info['duration'] = float(fmt['duration'])
+    if fmt.get('size') not in (None, 'N/A'):
+        info['size'] = int(fmt['size'])
+    for stream in probe.get('streams', []):
+        if stream.get('codec_type') == 'video' and stream.get('width'):
+            info['width'] = int(stream['width'])
+            info['height'] = int(stream['height'])
+            break
+    return info
+
+def probe_inputs(urls):
+    """Probe up to ADMISSION_MAX_PROBES inputs concurrently and extrapolate the totals to the rest."""
+    if not urls:
+        return {}
+    sample = urls[:ADMISSION_MAX_PROBES]
+    with ThreadPoolExecutor(max_workers=len(sample)) as executor:
+        probes = list(executor.map(probe_media, sample))
+
+    durations = [p.get('duration', DEFAULT_MEDIA_DURATION) for p in probes]
+    sizes = [p.get('size', 0) for p in probes]
+    scale = len(urls) / len(sample)
+    features = {
+        'input_count': len(urls),
+        'duration': sum(durations) * scale,
+        'size': int(sum(sizes) * scale),
+    }
+    pixels = [p['width'] * p['height'] for p in probes if p.get('width')]
+    if pixels:
+        features['pixels'] = max(pixels)
+    return features
+
+def estimate_job_cost(endpoint, job_class, data):
+    """Estimate run time, peak RAM and scratch disk for a job from its endpoint, options and input media.
+
+    The run time comes from the model learned on past jobs once there is enough history,
+    and from the static per-class costs below until then.
+    """
+    features = {'endpoint': endpoint}
+    if job_class != 'io':
+        features.update(probe_inputs(find_media_urls(data)))
+    duration = features.get('duration', 0)
+    size = features.get('size', 0)
+
+    seconds = JOB_OVERHEAD_SECONDS
+    memory = 0
+    disk = 0
+
+    if job_class == 'whisper':
+        transcribes = endpoint != '/v1/video/caption' or not data.get('captions')
+        if transcribes:
+            model_size = data.get('model_size') or DEFAULT_WHISPER_MODELS.get(endpoint, 'base')
+            features['model_size'] = model_size
+            features['backend'] = data.get('backend') or TRANSCRIBE_BACKEND
+            per_second, model_memory = WHISPER_MODEL_COSTS.get(model_size, WHISPER_MODEL_COSTS['medium'])
+            seconds += duration * per_second
+            memory = max(memory, model_memory)
+        disk = max(disk, size)
+    if job_class == 'ffmpeg' or endpoint == '/v1/video/caption':
+        resolution_factor = features.get('pixels', 1920 * 1080) / (1920 * 1080)
+        seconds += duration * FFMPEG_SECONDS_PER_MEDIA_SECOND * max(resolution_factor, 0.25)
+        memory = max(memory, FFMPEG_MEMORY)
+        # Inputs plus an output of similar size
+        disk = max(disk, 2 * size)
+    if job_class == 'io':
+        seconds += size / IO_BYTES_PER_SECOND
+
+    outputs = data.get('outputs')
+    if outputs:
+        features['output_count'] = len(outputs)
+
+    return {
+        'features': features,
+        'seconds': predict_run_time(features, round(seconds, 3)),
+        'memory': int(memory),
+        'disk': int(disk),
+    }
+
+def projected_drain_time(job_class, slots, jobs=None):
+    """Seconds until the jobs of a class currently queued or running are expected to finish."""
+    jobs = active_jobs() if jobs is None else jobs
+    now = time.time()
+    remaining = 0
+    for job in jobs:
+        if job['job_class'] != job_class:
+            continue
+        seconds = job['cost'].get('seconds', JOB_OVERHEAD_SECONDS)
+        if job['status'] == 'running' and job['started_at']:
+            seconds = max(seconds - (now - job['started_at']), 0)
+        remaining += seconds
+    return remaining / max(slots, 1)
+
+def _pending_disk(job):
+    """Scratch disk a queued or running job has yet to write: running jobs already hold part of theirs."""
+    estimate = job['cost'].get('disk', 0)
+    if job['status'] != 'running' or not estimate:
+        return estimate
+    return max(0, estimate - directory_usage(os.path.join(WORKSPACE_ROOT, job['job_id'])))
+
+def _memory_key(job_class, cost):
+    """Whisper jobs of one model share a single loaded copy of it; other jobs need memory of their own."""
+    features = cost.get('features', {})
+    if job_class == 'whisper' and features.get('model_size'):
+        return f"{features.get('backend')}:{features['model_size']}"
+    return None
+
+def _memory_demand(jobs, class_slots, job_class, cost):
+    """RAM the jobs that can start next will claim on top of what is in use now.
+
+    Only as many jobs as a class has free slots run at once, so each class counts its largest
+    queued jobs (the new one included) up to that number. Running jobs already show in available
+    RAM, and so do the Whisper models they loaded.
+    """
+    loaded_models = {_memory_key(job['job_class'], job['cost']) for job in jobs if job['status'] == 'running'}
+    demand = {}
+    for slot_class, slots in class_slots.items():
+        running = sum(1 for job in jobs if job['job_class'] == slot_class and job['status'] == 'running')
+        queued = [job['cost'] for job in jobs if job['job_class'] == slot_class and job['status'] == 'queued']
+        if slot_class == job_class:
+            queued.append(cost)
+        next_jobs = sorted(queued, key=lambda job_cost: job_cost.get('memory', 0), reverse=True)[:max(slots - running, 0)]
+        for index, job_cost in enumerate(next_jobs):
+            key = _memory_key(slot_class, job_cost)
+            if key in loaded_models:
+                continue
+            key = key or (slot_class, index)
+            demand[key] = max(demand.get(key, 0), job_cost.get('memory', 0))
+    return sum(demand.values())
+
+def check_admission(job_class, cost, class_slots):
+    """Decide whether a job can be queued now. class_slots is the number of slots of each job class.
+
+    Returns (True, None, None) when admitted, or (False, reason, retry_after_seconds). The length
+    of the queue itself is only bounded by ADMISSION_MAX_BACKLOG, through the projected drain time.
+    """
+    slots = class_slots[job_class]
+    jobs = active_jobs()
+    queued = [job for job in jobs if job['status'] == 'queued']
+    drain_time = projected_drain_time(job_class, slots, jobs)
+    retry_after = max(1, math.ceil(drain_time))
+
+    if _memory_demand(jobs, class_slots, job_class, cost) > psutil.virtual_memory().available - ADMISSION_MEMORY_RESERVE:
+        return False, f"Not enough memory: job needs ~{cost['memory'] / GB:.1f} GB", retry_after
+
+    # Likewise, what running jobs have written is already gone from the free space
+    free_disk = psutil.disk_usage(ADMISSION_DISK_PATH).free - sum(_pending_disk(job) for job in jobs)
+    if cost['disk'] > free_disk - ADMISSION_DISK_RESERVE:
+        return False, f"Not enough free space in {ADMISSION_DISK_PATH}: job needs ~{cost['disk'] / GB:.1f} GB", retry_after
+
+    if queued and psutil.cpu_percent(interval=None) >= ADMISSION_MAX_CPU:
+        return False, "CPU saturated", retry_after
+
+    if ADMISSION_MAX_BACKLOG > 0 and drain_time + cost['seconds'] / max(slots, 1) > ADMISSION_MAX_BACKLOG:
+        return False, f"Estimated backlog exceeds ADMISSION_MAX_BACKLOG ({int(ADMISSION_MAX_BACKLOG)}s)", retry_after
+
+    return True, None, None
@@ -0,0 +1,76 @@
+import os
+import logging
+import uuid
+import hashlib
+import subprocess
+from collections import namedtuple
+import numpy as np
+from services.job_queue import job_stage
+
+logger = logging.getLogger(__name__)
+
+# Whisper's input format: 16 kHz mono float32
+SAMPLE_RATE = 16000
+
+# A range of samples of a PCM file, passed instead of the audio itself so it can cross process boundaries
+PcmSlice = namedtuple('PcmSlice', ['path', 'start', 'end'])
+
+def decode_to_pcm(media_path, pcm_path):
+    """Decode the audio track of a media file to raw 16 kHz mono float32 samples in pcm_path.
+
+    Only the first audio stream is mapped, so video, subtitle and data packets are skipped by the
+    demuxer instead of being decoded.
+    """
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-y',
+        '-i', media_path,
+        '-map', '0:a:0', '-vn', '-sn', '-dn', '-ac', '1', '-ar', str(SAMPLE_RATE),
+        '-f', 'f32le', pcm_path
+    ]
+    with job_stage('decode'):
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+        except subprocess.CalledProcessError as e:
+            raise Exception(f"Failed to decode audio: {e.stderr.strip()}")
+    return pcm_path
+
+def extract_audio(media_path):
+    """Path of the decoded audio of an input, decoded on first use and reused by every later stage.
+
+    The artifact sits next to the input in the job workspace (<input>.pcm) and goes away with it,
+    so transcription, voice activity detection and any other analysis of the same input share a
+    single decode. It is written under a temporary name and renamed, so a file at the final path
+    is always complete.
+    """
+    pcm_path = f"{media_path}.pcm"
+    if os.path.exists(pcm_path):
+        logger.info(f"Reusing decoded audio of {os.path.basename(media_path)}")
+        return pcm_path
+    temp_path = f"{pcm_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        decode_to_pcm(media_path, temp_path)
+        os.replace(temp_path, pcm_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return pcm_path
+
+def load_pcm(pcm_path):
+    """Samples of a PCM file, memory-mapped rather than read into RAM."""
+    if os.path.getsize(pcm_path) == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(pcm_path, dtype=np.float32, mode='r')
+
+def pcm_hash(pcm_path, chunk_size=8 * 1024 * 1024):
+    """SHA-256 of decoded samples: the same recording hashes the same in any container or bitrate."""
+    digest = hashlib.sha256()
+    with open(pcm_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def resolve_audio(audio):
+    """Audio in a form the transcription engines accept: a file path as is, a PcmSlice as an array."""
+    if isinstance(audio, PcmSlice):
+        return np.array(load_pcm(audio.path)[audio.start:audio.end])
+    return audio
@@ -1,23 +1,71 @@
 import os
+import time
+import hashlib
 import logging
+import threading
 from abc import ABC, abstractmethod
-from services.gcp_toolkit import upload_to_gcs
-from services.s3_toolkit import upload_to_s3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from services.gcp_toolkit import upload_to_gcs, upload_stream_to_gcs, gcs_object_url
+from services.s3_toolkit import upload_to_s3, upload_stream_to_s3, s3_object_url
+from services.local_storage import store_local, store_local_stream, local_object_url, LOCAL_STORAGE_PATH
+from services.job_queue import job_stage, get_connection
 from config import validate_env_vars
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
+# Uploads kept for the storage metrics endpoint
+RECENT_UPLOADS = 50
+
+# Files uploaded at the same time by upload_files
+UPLOAD_BATCH_CONCURRENCY = int(os.environ.get('UPLOAD_BATCH_CONCURRENCY', 16))
+
+# Name uploads by their SHA-256 and skip those already in the bucket, unless the caller decides
+UPLOAD_CONTENT_ADDRESSED = os.environ.get('UPLOAD_CONTENT_ADDRESSED', 'false').lower() == 'true'
+
+# Seconds an object in the local upload index is trusted before it is checked again with a HEAD request
+UPLOAD_INDEX_TTL = float(os.environ.get('UPLOAD_INDEX_TTL', 24 * 3600))
+
 class CloudStorageProvider(ABC):
+    # Whether object_url() answers may be reused for UPLOAD_INDEX_TTL instead of asking the provider each time
+    index_objects = True
+
     @abstractmethod
-    def upload_file(self, file_path: str) -> str:
+    def upload_file(self, file_path: str, object_name: str = None) -> str:
         pass
 
+    @abstractmethod
+    def upload_stream(self, stream, object_name: str) -> str:
+        pass
+
+    @abstractmethod
+    def object_url(self, object_name: str):
+        """URL of an existing object, or None if it isn't stored."""
+        pass
+
+    @property
+    def location(self) -> str:
+        """Identifies the bucket uploads go to, so the upload index never mixes destinations."""
+        return type(self).__name__
+
 class GCPStorageProvider(CloudStorageProvider):
     def __init__(self):
         self.bucket_name = os.getenv('GCP_BUCKET_NAME')
 
-    def upload_file(self, file_path: str) -> str:
-        return upload_to_gcs(file_path, self.bucket_name)
+    def upload_file(self, file_path: str, object_name: str = None) -> str:
+        return upload_to_gcs(file_path, self.bucket_name, object_name)
+
+    def upload_stream(self, stream, object_name: str) -> str:
+        return upload_stream_to_gcs(stream, object_name, self.bucket_name)
+
+    def object_url(self, object_name: str):
+        return gcs_object_url(object_name, self.bucket_name)
+
+    @property
+    def location(self) -> str:
+        return f"gcs:{self.bucket_name}"
 
 class S3CompatibleProvider(CloudStorageProvider):
     def __init__(self):
@@ -25,25 +73,247 @@ class S3CompatibleProvider(CloudStorageProvider):
         self.access_key = os.getenv('S3_ACCESS_KEY')
         self.secret_key = os.getenv('S3_SECRET_KEY')
 
-    def upload_file(self, file_path: str) -> str:
-        return upload_to_s3(file_path, self.endpoint_url, self.access_key, self.secret_key)
+    def upload_file(self, file_path: str, object_name: str = None) -> str:
+        return upload_to_s3(file_path, self.endpoint_url, self.access_key, self.secret_key, object_name)
+
+    def upload_stream(self, stream, object_name: str) -> str:
+        return upload_stream_to_s3(stream, object_name, self.endpoint_url, self.access_key, self.secret_key)
+
+    def object_url(self, object_name: str):
+        return s3_object_url(object_name, self.endpoint_url, self.access_key, self.secret_key)
+
+    @property
+    def location(self) -> str:
+        return f"s3:{self.endpoint_url}"
+
+class LocalStorageProvider(CloudStorageProvider):
+    """Publishes outputs from a directory served by nginx, for consumers on the same host."""
+    # Files expire after LOCAL_STORAGE_TTL, and checking one is only a stat
+    index_objects = False
+
+    def upload_file(self, file_path: str, object_name: str = None) -> str:
+        return store_local(file_path, object_name)
+
+    def upload_stream(self, stream, object_name: str) -> str:
+        return store_local_stream(stream, object_name)
+
+    def object_url(self, object_name: str):
+        return local_object_url(object_name)
+
+    @property
+    def location(self) -> str:
+        return f"local:{LOCAL_STORAGE_PATH}"
+
+# Providers in order of preference; the first one whose environment variables are set is used
+STORAGE_PROVIDERS = {
+    'LOCAL': LocalStorageProvider,
+    'GCP': GCPStorageProvider,
+    'S3': S3CompatibleProvider,
+}
+
+_provider = None
+_provider_pid = None
+_provider_lock = threading.Lock()
+_index_pid = None
+_metrics_lock = threading.Lock()
+_metrics = {
+    "uploads": 0,
+    "skipped": 0,
+    "skipped_bytes": 0,
+    "failed": 0,
+    "bytes": 0,
+    "seconds": 0.0,
+}
+_recent_uploads = deque(maxlen=RECENT_UPLOADS)
 
 def get_storage_provider() -> CloudStorageProvider:
+    """Return the configured provider, created once per process so its clients and connection pools are reused."""
+    global _provider, _provider_pid
+    with _provider_lock:
+        if _provider is None or _provider_pid != os.getpid():
+            error = None
+            for name, provider_class in STORAGE_PROVIDERS.items():
+                try:
+                    validate_env_vars(name)
+                except ValueError as e:
+                    error = e
+                    continue
+                _provider = provider_class()
+                _provider_pid = os.getpid()
+                logger.info(f"Using {name} cloud storage")
+                break
+            else:
+                raise error
+        return _provider
+
+class _CountingReader:
+    """Counts the bytes read from a stream and adds tell(), which resumable uploads need."""
+    def __init__(self, stream):
+        self.stream = stream
+        self.position = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        return self.position
+
+def _record_upload(object_name, size, seconds, provider):
+    """Log and keep the throughput of a finished upload."""
+    seconds = max(seconds, 1e-6)
+    rate = size / seconds / MB
+    with _metrics_lock:
+        _metrics["uploads"] += 1
+        _metrics["bytes"] += size
+        _metrics["seconds"] += seconds
+        _recent_uploads.append({
+            "object": object_name,
+            "provider": type(provider).__name__,
+            "bytes": size,
+            "seconds": round(seconds, 3),
+            "mb_per_second": round(rate, 2),
+            "finished_at": time.time(),
+        })
+    logger.info(f"Uploaded {object_name}: {size} bytes in {seconds:.2f}s ({rate:.1f} MB/s)")
+
+def _record_failure():
+    with _metrics_lock:
+        _metrics["failed"] += 1
+
+def get_upload_metrics():
+    """Upload counters and the most recent uploads of this worker."""
+    with _metrics_lock:
+        metrics = dict(_metrics)
+        recent = list(_recent_uploads)
+    seconds = metrics.pop("seconds")
+    metrics["average_mb_per_second"] = round(metrics["bytes"] / seconds / MB, 2) if seconds else None
+    metrics["pid"] = os.getpid()
+    return {"metrics": metrics, "recent_uploads": recent[::-1]}
+
+def _get_index():
+    """Connection to the index of content-addressed objects known to be in the bucket."""
+    global _index_pid
+    conn = get_connection()
+    if _index_pid != os.getpid():
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS uploaded_objects (
+                location TEXT NOT NULL,
+                object_name TEXT NOT NULL,
+                url TEXT NOT NULL,
+                checked_at REAL NOT NULL,
+                PRIMARY KEY (location, object_name)
+            )
+        """)
+        _index_pid = os.getpid()
+    return conn
+
+def content_object_name(file_path):
+    """Object name derived from the file's SHA-256, keeping its extension."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(MB), b''):
+            digest.update(block)
+    return digest.hexdigest() + os.path.splitext(file_path)[1]
+
+def _existing_object_url(provider, object_name):
+    """URL of an identical object uploaded before: from the local index, or from a HEAD request."""
+    if provider.index_objects:
+        row = _get_index().execute(
+            "SELECT url, checked_at FROM uploaded_objects WHERE location = ? AND object_name = ?",
+            (provider.location, object_name)
+        ).fetchone()
+        if row and time.time() - row['checked_at'] < UPLOAD_INDEX_TTL:
+            return row['url']
     try:
-        validate_env_vars('GCP')
-        return GCPStorageProvider()
-    except ValueError:
-        validate_env_vars('S3')
-        return S3CompatibleProvider()
+        url = provider.object_url(object_name)
+    except Exception as e:
+        logger.warning(f"Could not check whether {object_name} is already stored: {e}")
+        return None
+    if url and provider.index_objects:
+        _remember_object(provider, object_name, url)
+    return url
+
+def _remember_object(provider, object_name, url):
+    _get_index().execute(
+        "INSERT OR REPLACE INTO uploaded_objects (location, object_name, url, checked_at) VALUES (?, ?, ?, ?)",
+        (provider.location, object_name, url, time.time())
+    )
 
-def upload_file(file_path: str) -> str:
+def upload_file(file_path: str, content_addressed: bool = None) -> str:
+    """Upload a file and return its URL.
+
+    With content_addressed (default UPLOAD_CONTENT_ADDRESSED), the object is named after the
+    file's SHA-256 and the transfer is skipped when that object is already stored.
+    """
     provider = get_storage_provider()
+    if content_addressed is None:
+        content_addressed = UPLOAD_CONTENT_ADDRESSED
     try:
         logger.info(f"Uploading file to cloud storage: {file_path}")
-        url = provider.upload_file(file_path)
+        size = os.path.getsize(file_path)
+        start = time.time()
+        with job_stage('upload'):
+            object_name = content_object_name(file_path) if content_addressed else None
+            url = _existing_object_url(provider, object_name) if content_addressed else None
+            if url:
+                with _metrics_lock:
+                    _metrics["skipped"] += 1
+                    _metrics["skipped_bytes"] += size
+                logger.info(f"Skipped upload of {file_path}: identical object already stored at {url}")
+                return url
+            url = provider.upload_file(file_path, object_name)
+            if content_addressed and provider.index_objects:
+                _remember_object(provider, object_name, url)
+        _record_upload(object_name or os.path.basename(file_path), size, time.time() - start, provider)
         logger.info(f"File uploaded successfully: {url}")
         return url
     except Exception as e:
+        _record_failure()
         logger.error(f"Error uploading file to cloud storage: {e}")
         raise
-    
\ No newline at end of file
+
+def upload_files(file_paths, max_workers=UPLOAD_BATCH_CONCURRENCY, content_addressed=None):
+    """Upload many files concurrently over the provider's pooled connections.
+
+    Returns (urls, failures): urls follows the order of file_paths with None for files that
+    failed, and failures lists {"index", "file", "error"} for each of them.
+    """
+    if not file_paths:
+        return [], []
+    get_storage_provider()  # Resolve the provider once, before the threads start
+
+    def upload(file_path):
+        try:
+            return upload_file(file_path, content_addressed), None
+        except Exception as e:
+            return None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_paths)))) as executor:
+        results = list(executor.map(upload, file_paths))
+
+    urls = [url for url, _ in results]
+    failures = [
+        {"index": index, "file": os.path.basename(file_path), "error": error}
+        for index, (file_path, (_, error)) in enumerate(zip(file_paths, results)) if error
+    ]
+    if failures:
+        logger.error(f"{len(failures)} of {len(file_paths)} uploads failed")
+    return urls, failures
+
+def upload_stream(stream, object_name: str) -> str:
+    """Upload data read from a stream (e.g. ffmpeg stdout) in chunks, without a local file."""
+    provider = get_storage_provider()
+    try:
+        logger.info(f"Streaming upload to cloud storage: {object_name}")
+        reader = _CountingReader(stream)
+        start = time.time()
+        url = provider.upload_stream(reader, object_name)
+        _record_upload(object_name, reader.tell(), time.time() - start, provider)
+        logger.info(f"Stream uploaded successfully: {url}")
+        return url
+    except Exception as e:
+        _record_failure()
+        logger.error(f"Error streaming upload to cloud storage: {e}")
+        raise
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import fcntl
+import shutil
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from services.job_queue import get_connection
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Set to 'false' to download every input from scratch
+DOWNLOAD_CACHE = os.environ.get('DOWNLOAD_CACHE', 'true').lower() == 'true'
+
+# Must be on the same filesystem as the job scratch space so cached files can be hardlinked
+DOWNLOAD_CACHE_DIR = os.environ.get('DOWNLOAD_CACHE_DIR', '/tmp/nca_download_cache')
+
+# Bytes of cached content kept before the least recently used files are evicted
+DOWNLOAD_CACHE_MAX_BYTES = float(os.environ.get('DOWNLOAD_CACHE_MAX_GB', 20)) * GB
+
+_initialized_pid = None
+_init_lock = threading.Lock()
+
+def _init_cache():
+    """Create the cache directories and index tables once per process."""
+    global _initialized_pid
+    with _init_lock:
+        if _initialized_pid == os.getpid():
+            return
+        for name in ('objects', 'locks', 'tmp'):
+            os.makedirs(os.path.join(DOWNLOAD_CACHE_DIR, name), exist_ok=True)
+        conn = get_connection()
+        # One row per URL with its HTTP validators, one row per distinct content
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS download_cache_urls (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS download_cache_urls_hash ON download_cache_urls (content_hash)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS download_cache_objects (
+                content_hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        _initialized_pid = os.getpid()
+
+def object_path(content_hash):
+    return os.path.join(DOWNLOAD_CACHE_DIR, 'objects', content_hash)
+
+def temp_path():
+    """Scratch file inside the cache directory, so a finished download can be renamed into place."""
+    _init_cache()
+    return os.path.join(DOWNLOAD_CACHE_DIR, 'tmp', str(uuid.uuid4()))
+
+@contextmanager
+def url_lock(url):
+    """Hold an exclusive lock on a URL across threads and workers, so it is only fetched once at a time."""
+    _init_cache()
+    key = hashlib.sha256(url.encode()).hexdigest()
+    with open(os.path.join(DOWNLOAD_CACHE_DIR, 'locks', key), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def lookup(url):
+    """Cached entry of a URL, with its content hash and validators, or None."""
+    _init_cache()
+    row = get_connection().execute("SELECT * FROM download_cache_urls WHERE url = ?", (url,)).fetchone()
+    if row is None or not os.path.exists(object_path(row['content_hash'])):
+        return None
+    return dict(row)
+
+def touch(content_hash):
+    get_connection().execute(
+        "UPDATE download_cache_objects SET last_used = ? WHERE content_hash = ?",
+        (time.time(), content_hash)
+    )
+
+def store(url, path, content_hash, etag=None, last_modified=None):
+    """Move a finished download into the cache and index it under its URL. Returns the cached path.
+
+    Content that is already cached under another URL is kept once; the new download is dropped.
+    """
+    cached_path = object_path(content_hash)
+    if os.path.exists(cached_path):
+        os.remove(path)
+    else:
+        os.replace(path, cached_path)
+
+    now = time.time()
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO download_cache_urls (url, content_hash, etag, last_modified, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (url, content_hash, etag, last_modified, now)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO download_cache_objects (content_hash, size, last_used) VALUES (?, ?, ?)",
+            (content_hash, os.path.getsize(cached_path), now)
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return cached_path
+
+def forget(url):
+    """Drop the entry of a URL whose cached copy is gone, so its next fetch doesn't revalidate against it."""
+    get_connection().execute("DELETE FROM download_cache_urls WHERE url = ?", (url,))
+
+def link(cached_path, destination):
+    """Hardlink a cached file into a job's scratch space, copying it if the link isn't possible.
+
+    Jobs own their link and may delete it; the cached copy stays until it is evicted. Raises
+    FileNotFoundError when the cached copy was evicted in the meantime.
+    """
+    try:
+        os.link(cached_path, destination)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        shutil.copyfile(cached_path, destination)
+
+def evict(keep=None):
+    """Remove least recently used content until the cache fits in DOWNLOAD_CACHE_MAX_BYTES."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute("SELECT content_hash, size FROM download_cache_objects ORDER BY last_used").fetchall()
+        total = sum(row['size'] for row in rows)
+        evicted = []
+        for row in rows:
+            if total <= DOWNLOAD_CACHE_MAX_BYTES:
+                break
+            if row['content_hash'] == keep:
+                continue
+            conn.execute("DELETE FROM download_cache_objects WHERE content_hash = ?", (row['content_hash'],))
+            conn.execute("DELETE FROM download_cache_urls WHERE content_hash = ?", (row['content_hash'],))
+            total -= row['size']
+            evicted.append(row['content_hash'])
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    for content_hash in evicted:
+        try:
+            os.remove(object_path(content_hash))
+        except FileNotFoundError:
+            pass
+    if evicted:
+        logger.info(f"Evicted {len(evicted)} files from the download cache")
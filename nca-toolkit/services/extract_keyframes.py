@@ -1,18 +1,18 @@
 import os
 import subprocess
 import json
-from services.file_management import download_file
+from services.file_management import prepare_input, input_args
+from services.workspace import workspace_dir
 
-STORAGE_PATH = "/tmp/"
-
-def process_keyframe_extraction(video_url, job_id):
-    video_path = download_file(video_url, STORAGE_PATH)
+def process_keyframe_extraction(video_url, job_id, stream=False):
+    video_source, input_options, video_path = prepare_input(video_url, workspace_dir(), stream)
 
     # Extract keyframes
-    output_pattern = os.path.join(STORAGE_PATH, f"{job_id}_%03d.jpg")
+    output_pattern = os.path.join(workspace_dir(), f"{job_id}_%03d.jpg")
     cmd = [
         'ffmpeg',
-        '-i', video_path,
+        *input_args(input_options),
+        '-i', video_source,
         '-vf', f"select='eq(pict_type,I)',scale=iw*sar:ih,setsar=1",
         '-vsync', 'vfr',
         output_pattern
@@ -24,12 +24,13 @@ def process_keyframe_extraction(video_url, job_id):
 
     # Upload keyframes to GCS and get URLs
     output_filenames = []
-    for filename in sorted(os.listdir(STORAGE_PATH)):
+    for filename in sorted(os.listdir(workspace_dir())):
         if filename.startswith(f"{job_id}_") and filename.endswith(".jpg"):
-            file_path = os.path.join(STORAGE_PATH, filename)
+            file_path = os.path.join(workspace_dir(), filename)
             output_filenames.append(file_path)
 
     # Clean up input file
-    os.remove(video_path)
+    if video_path:
+        os.remove(video_path)
 
     return output_filenames
\ No newline at end of file
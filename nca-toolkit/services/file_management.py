@@ -1,9 +1,245 @@
 import os
+import time
 import uuid
+import hashlib
+import logging
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlparse, parse_qs
+from services import download_cache
+from services.job_queue import job_stage
+from services.workspace import SHARED_SCRATCH, check_quota
+from services.s3_toolkit import s3_object_version, download_from_s3
+from services.gcp_toolkit import gcs_object_version, download_from_gcs
 
-def download_file(url, storage_path="/tmp/"):
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Concurrent byte-range requests per download when the server supports them (1 = single stream)
+DOWNLOAD_CONNECTIONS = int(os.environ.get('DOWNLOAD_CONNECTIONS', 4))
+
+# Files smaller than two parts are fetched in a single stream
+DOWNLOAD_MIN_PART_SIZE = int(float(os.environ.get('DOWNLOAD_MIN_PART_MB', 8)) * MB)
+
+# Bytes buffered in memory per stream before each write to disk
+DOWNLOAD_BUFFER_SIZE = int(float(os.environ.get('DOWNLOAD_BUFFER_MB', 4)) * MB)
+
+# Inputs of one job downloaded at the same time
+DOWNLOAD_CONCURRENCY = int(os.environ.get('DOWNLOAD_CONCURRENCY', 4))
+
+# Seconds to wait for a connection and between bytes
+DOWNLOAD_TIMEOUT = float(os.environ.get('DOWNLOAD_TIMEOUT', 60))
+
+# ffmpeg input options for reading a URL directly, reconnecting when the connection drops
+STREAM_INPUT_OPTIONS = {
+    'reconnect': 1,
+    'reconnect_streamed': 1,
+    'reconnect_on_network_error': 1,
+    'reconnect_delay_max': 5,
+}
+
+# Top-level boxes that can start an MP4/MOV file, and how many boxes to walk looking for moov
+MP4_FIRST_BOXES = {b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide', b'pnot'}
+MP4_MAX_PROBED_BOXES = 16
+
+_session = None
+_session_lock = threading.Lock()
+
+class RangesNotSupported(Exception):
+    pass
+
+class DownloadCancelled(Exception):
+    pass
+
+def _get_session():
+    """One keep-alive session shared by every download, with room for all range connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=max(DOWNLOAD_CONNECTIONS * 4, 10))
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+def open_stream(url):
+    """Streamed GET of url on the shared download session; the caller closes the response."""
+    response = _get_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    return response
+
+def _check_cancelled(url, cancel):
+    if cancel is not None and cancel.is_set():
+        raise DownloadCancelled(f"Download of {url} was cancelled")
+
+def _stream(response, path, cancel=None):
+    """Write a streamed response body to path and return the SHA-256 of its content.
+
+    Raises DownloadCancelled between chunks once cancel is set.
+    """
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'wb', buffering=DOWNLOAD_BUFFER_SIZE) as f:
+            for chunk in response.iter_content(chunk_size=MB):
+                _check_cancelled(response.url, cancel)
+                f.write(chunk)
+                digest.update(chunk)
+    except DownloadCancelled:
+        response.close()
+        raise
+    return digest.hexdigest()
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(DOWNLOAD_BUFFER_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _fetch_range(url, fd, start, end, validator, abort, cancel=None):
+    """Fetch bytes start..end (inclusive) and write them at the same offset of fd.
+
+    abort stops the part quietly when a sibling part failed; cancel raises DownloadCancelled.
+    """
+    headers = {'Range': f"bytes={start}-{end}"}
+    if validator:
+        # The server answers with the whole body instead of a range if the file changed meanwhile
+        headers['If-Range'] = validator
+    with _get_session().get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code != 206:
+            raise RangesNotSupported(f"Range request answered with {response.status_code}")
+        offset = start
+        buffer = bytearray()
+        for chunk in response.iter_content(chunk_size=MB):
+            if abort.is_set():
+                return
+            _check_cancelled(url, cancel)
+            buffer += chunk
+            if len(buffer) >= DOWNLOAD_BUFFER_SIZE:
+                os.pwrite(fd, buffer, offset)
+                offset += len(buffer)
+                buffer.clear()
+        if buffer:
+            os.pwrite(fd, buffer, offset)
+            offset += len(buffer)
+    if offset != end + 1:
+        raise IOError(f"Range {start}-{end} of {url} ended after {offset - start} bytes")
+
+def _fetch_ranges(url, path, size, validator, cancel=None):
+    """Download size bytes of url into a preallocated file with DOWNLOAD_CONNECTIONS concurrent ranges."""
+    part_size = max(-(-size // DOWNLOAD_CONNECTIONS), DOWNLOAD_MIN_PART_SIZE)
+    parts = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    abort = threading.Event()
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except OSError:
+            os.ftruncate(fd, size)
+        with ThreadPoolExecutor(max_workers=len(parts)) as executor:
+            futures = [executor.submit(_fetch_range, url, fd, start, end, validator, abort, cancel) for start, end in parts]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                abort.set()
+                raise
+    finally:
+        os.close(fd)
+    return len(parts)
+
+def _fetch(url, path, headers=None, cancel=None):
+    """Download url to path, with concurrent byte ranges when the server allows it.
+
+    Returns the response and the SHA-256 of the content, or (response, None) when the server
+    answered 304 Not Modified to the conditional headers.
+    """
+    start_time = time.time()
+    response = _get_session().get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT)
+    if response.status_code == 304:
+        response.close()
+        return response, None
+    response.raise_for_status()
+
+    size = int(response.headers.get('Content-Length') or 0)
+    etag = response.headers.get('ETag')
+    # If-Range only accepts strong ETags
+    validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+    connections = 1
+    if (DOWNLOAD_CONNECTIONS > 1 and size >= 2 * DOWNLOAD_MIN_PART_SIZE
+            and response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+            and not response.headers.get('Content-Encoding')):
+        response.close()
+        try:
+            connections = _fetch_ranges(url, path, size, validator, cancel)
+            content_hash = _hash_file(path)
+        except RangesNotSupported as e:
+            logger.info(f"Falling back to a single stream for {url}: {e}")
+            connections = 1
+            _check_cancelled(url, cancel)
+            response = _get_session().get(url, stream=True, timeout=DOWNLOAD_TIMEOUT)
+            response.raise_for_status()
+    if connections == 1:
+        content_hash = _stream(response, path, cancel)
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    size = os.path.getsize(path)
+    logger.info(
+        f"Downloaded {url}: {size} bytes in {elapsed:.2f}s "
+        f"({size / elapsed / MB:.1f} MB/s, {connections} connection{'s' if connections > 1 else ''})"
+    )
+    return response, content_hash
+
+def is_object_url(url):
+    """True for s3:// and gs:// URIs, which are read from the bucket with the configured credentials."""
+    return urlparse(url).scheme in ('s3', 'gs')
+
+def _split_object_url(url):
+    parsed = urlparse(url)
+    object_name = parsed.path.lstrip('/')
+    if not parsed.netloc or not object_name:
+        raise ValueError(f"Invalid object URL, expected {parsed.scheme}://bucket/object: {url}")
+    return parsed.scheme, parsed.netloc, object_name
+
+def _fetch_object(url, path, cached_version=None, cancel=None):
+    """Download an s3:// or gs:// object to path, in DOWNLOAD_CONNECTIONS parallel ranges.
+
+    Returns the object's version (ETag or generation) and the SHA-256 of its content, or
+    (version, None) without downloading when the object still has cached_version. S3 transfers
+    stop between chunks once cancel is set; the GCS client can't be interrupted, so gs:// objects
+    are only checked before and after the transfer.
+    """
+    start_time = time.time()
+    scheme, bucket_name, object_name = _split_object_url(url)
+    if scheme == 's3':
+        version = s3_object_version(bucket_name, object_name)
+    else:
+        version = gcs_object_version(bucket_name, object_name)
+    if cached_version and version == cached_version:
+        return version, None
+
+    _check_cancelled(url, cancel)
+    if scheme == 's3':
+        download_from_s3(
+            bucket_name, object_name, path, DOWNLOAD_MIN_PART_SIZE, DOWNLOAD_CONNECTIONS,
+            callback=lambda _: _check_cancelled(url, cancel)
+        )
+    else:
+        download_from_gcs(bucket_name, object_name, path, version, DOWNLOAD_MIN_PART_SIZE, DOWNLOAD_CONNECTIONS)
+    _check_cancelled(url, cancel)
+    content_hash = _hash_file(path)
+
+    elapsed = max(time.time() - start_time, 1e-6)
+    size = os.path.getsize(path)
+    logger.info(f"Downloaded {url}: {size} bytes in {elapsed:.2f}s ({size / elapsed / MB:.1f} MB/s)")
+    return version, content_hash
+
+def download_file(url, storage_path="/tmp/", cancel=None):
     # Parse the URL to extract the file ID from the query parameters
     parsed_url = urlparse(url)
     query_params = parse_qs(parsed_url.query)
@@ -21,20 +257,194 @@ def download_file(url, storage_path="/tmp/"):
     # Use the file ID as the filename and save it in the specified storage path
     local_filename = os.path.join(storage_path, f"{file_id}.mp4")  # Assuming mp4; adjust extension if needed
     
-    # Download the file
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
-    
-    with open(local_filename, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    
+    # Counted as the job's download stage when called from the job thread
+    with job_stage('download'):
+        _download(url, local_filename, cancel)
+    try:
+        check_quota(local_filename)
+    except Exception:
+        os.remove(local_filename)
+        raise
     return local_filename
 
+def _download(url, local_filename, cancel=None):
+    if not download_cache.DOWNLOAD_CACHE:
+        try:
+            if is_object_url(url):
+                _fetch_object(url, local_filename, cancel=cancel)
+            else:
+                _fetch(url, local_filename, cancel=cancel)
+        except DownloadCancelled:
+            if os.path.exists(local_filename):
+                os.remove(local_filename)
+            raise
+        return
+
+    # Jobs asking for the same URL wait for one download, then share the cached copy
+    with download_cache.url_lock(url):
+        for attempt in range(2):
+            entry = download_cache.lookup(url)
+            temp_path = download_cache.temp_path()
+            try:
+                if is_object_url(url):
+                    # Objects are revalidated by comparing their version with the cached one
+                    etag, content_hash = _fetch_object(url, temp_path, entry['etag'] if entry else None, cancel)
+                    last_modified = None
+                else:
+                    headers = {}
+                    if entry and entry['etag']:
+                        headers['If-None-Match'] = entry['etag']
+                    if entry and entry['last_modified']:
+                        headers['If-Modified-Since'] = entry['last_modified']
+                    response, content_hash = _fetch(url, temp_path, headers, cancel)
+                    etag = response.headers.get('ETag')
+                    last_modified = response.headers.get('Last-Modified')
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+            if entry and content_hash is None:
+                download_cache.touch(entry['content_hash'])
+                cached_path = download_cache.object_path(entry['content_hash'])
+                logger.info(f"Download cache hit for {url}")
+            else:
+                cached_path = download_cache.store(url, temp_path, content_hash, etag=etag, last_modified=last_modified)
+            try:
+                download_cache.link(cached_path, local_filename)
+                break
+            except FileNotFoundError:
+                # Evicted by a download of another URL since the lookup; fetch it again without validators
+                if attempt:
+                    raise
+                logger.info(f"Cached copy of {url} was evicted, downloading it again")
+                download_cache.forget(url)
+
+    download_cache.evict(keep=os.path.basename(cached_path))
+
+def _read_range(url, start, length):
+    """Up to length bytes of url from offset start, or None when the server doesn't serve ranges."""
+    headers = {'Range': f"bytes={start}-{start + length - 1}"}
+    with _get_session().get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as response:
+        if response.status_code == 416:
+            return b''
+        response.raise_for_status()
+        if response.status_code != 206:
+            return None
+        return response.raw.read(length)
+
+def needs_staging(url):
+    """True when a remote file has to be downloaded before ffmpeg can decode it.
+
+    MP4/MOV files are only readable front to back when the moov atom comes before mdat, so their
+    top-level boxes are walked with small range requests. Other containers (MKV, WebM, MP3, WAV,
+    MPEG-TS...) can be streamed. Servers without range support are always staged, since ffmpeg
+    couldn't seek in them either.
+    """
+    offset = 0
+    for _ in range(MP4_MAX_PROBED_BOXES):
+        header = _read_range(url, offset, 16)
+        if header is None:
+            return True
+        if len(header) < 8:
+            return False
+        size = int.from_bytes(header[0:4], 'big')
+        box = header[4:8]
+        if offset == 0 and box not in MP4_FIRST_BOXES:
+            return False
+        if box == b'moov':
+            return False
+        if box == b'mdat':
+            return True
+        if size == 1:
+            size = int.from_bytes(header[8:16], 'big')
+        if size < 8:
+            # Box extends to the end of the file, or the header is corrupt
+            return True
+        offset += size
+    return True
+
+def is_streamable(url):
+    """True when ffmpeg can read url directly instead of a downloaded copy."""
+    if urlparse(url).scheme not in ('http', 'https'):
+        return False
+    try:
+        return not needs_staging(url)
+    except (requests.RequestException, OSError) as e:
+        logger.warning(f"Could not check whether {url} can be streamed, downloading it: {e}")
+        return False
+
+def prepare_input(url, storage_path="/tmp/", stream=False):
+    """Decide how ffmpeg reads an input.
+
+    With stream set, inputs that can be decoded front to back are read by ffmpeg straight from the
+    URL; everything else is downloaded. Returns (input, ffmpeg input options, local file to remove
+    afterwards or None).
+    """
+    if stream and is_streamable(url):
+        logger.info(f"Streaming {url} into ffmpeg")
+        return url, dict(STREAM_INPUT_OPTIONS), None
+    if stream:
+        logger.info(f"Staging {url} to disk before processing")
+    local_filename = download_file(url, storage_path)
+    return local_filename, {}, local_filename
+
+def input_args(options):
+    """ffmpeg command line arguments for a dict of input options."""
+    return [arg for name, value in options.items() for arg in (f"-{name}", str(value))]
+
+def download_files(urls, storage_path="/tmp/"):
+    """Download several inputs concurrently and return their local paths in the order of urls.
+
+    storage_path is a directory for all inputs or a list with one per URL. On the first failure,
+    downloads that haven't started are cancelled, the ones in flight stop at their next chunk, the
+    files already fetched are removed and the error is raised. The wall time is reported as the
+    job's download stage.
+    """
+    paths = storage_path if isinstance(storage_path, list) else [storage_path] * len(urls)
+    if not urls:
+        return []
+
+    with job_stage('download'):
+        with ThreadPoolExecutor(max_workers=max(1, min(DOWNLOAD_CONCURRENCY, len(urls)))) as executor:
+            cancel = threading.Event()
+            futures = [executor.submit(download_file, url, path, cancel) for url, path in zip(urls, paths)]
+            done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = [future for future in futures if future in done and future.exception() is not None]
+            if not failed:
+                return [future.result() for future in futures]
+
+            cancel.set()
+            for future in pending:
+                future.cancel()
+            wait(futures)
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    os.remove(future.result())
+            raise failed[0].exception()
+
+
+# Files written outside a job workspace, removed by delete_old_files()
+STORAGE_PATH = SHARED_SCRATCH
+
+# Seconds a file is kept in STORAGE_PATH
+MAX_FILE_AGE = float(os.environ.get('SHARED_SCRATCH_MAX_AGE', 3600))
 
-def delete_old_files():
-    now = time.time()
-    for filename in os.listdir(STORAGE_PATH):
-        file_path = os.path.join(STORAGE_PATH, filename)
-        if os.path.isfile(file_path) and os.stat(file_path).st_mtime < now - 3600:
-            os.remove(file_path)
+def delete_old_files(max_age=MAX_FILE_AGE):
+    """Remove files older than max_age seconds from STORAGE_PATH. Returns the number removed."""
+    if not os.path.isdir(STORAGE_PATH):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for dirpath, _, filenames in os.walk(STORAGE_PATH):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            try:
+                if os.lstat(file_path).st_mtime < cutoff:
+                    os.remove(file_path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    if removed:
+        logger.info(f"Removed {removed} old files from {STORAGE_PATH}")
+    return removed
@@ -2,7 +2,10 @@ import os
 import json
 import logging
 from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
 from google.cloud import storage
+from google.cloud.storage import transfer_manager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +16,21 @@ GCP_BUCKET_NAME = os.getenv('GCP_BUCKET_NAME')
 STORAGE_PATH = "/tmp/"
 gcs_client = None
 
+MB = 1024 * 1024
+
+# Chunk size of streamed resumable uploads, rounded to the multiple of 256 KB that GCS requires
+RESUMABLE_CHUNK_MULTIPLE = 256 * 1024
+UPLOAD_STREAM_CHUNK_SIZE = max(1, round(float(os.environ.get('UPLOAD_STREAM_CHUNK_MB', 8)) * MB / RESUMABLE_CHUNK_MULTIPLE)) * RESUMABLE_CHUNK_MULTIPLE
+
+# Files above the threshold are uploaded as GCS_UPLOAD_CHUNK_MB chunks sent by
+# GCS_UPLOAD_WORKERS threads and composed into one object by the server
+GCS_PARALLEL_UPLOAD_THRESHOLD = int(float(os.environ.get('GCS_PARALLEL_UPLOAD_THRESHOLD_MB', 64)) * MB)
+GCS_UPLOAD_CHUNK_SIZE = int(float(os.environ.get('GCS_UPLOAD_CHUNK_MB', 32)) * MB)
+GCS_UPLOAD_WORKERS = int(os.environ.get('GCS_UPLOAD_WORKERS', 8))
+
+# HTTP connections the shared client keeps open for concurrent uploads
+GCS_MAX_POOL_CONNECTIONS = int(os.environ.get('GCS_MAX_POOL_CONNECTIONS', 32))
+
 def initialize_gcp_client():
     GCP_SA_CREDENTIALS = os.getenv('GCP_SA_CREDENTIALS')
 
@@ -29,7 +47,10 @@ def initialize_gcp_client():
             credentials_info,
             scopes=GCS_SCOPES
         )
-        return storage.Client(credentials=gcs_credentials)
+        # The default session keeps 10 connections, fewer than concurrent uploads use
+        session = AuthorizedSession(gcs_credentials)
+        session.mount('https://', HTTPAdapter(pool_connections=GCS_MAX_POOL_CONNECTIONS, pool_maxsize=GCS_MAX_POOL_CONNECTIONS))
+        return storage.Client(credentials=gcs_credentials, _http=session)
     except Exception as e:
         logger.error(f"Failed to initialize GCS client: {e}")
         return None
@@ -37,17 +58,79 @@ def initialize_gcp_client():
 # Initialize the GCS client
 gcs_client = initialize_gcp_client()
 
-def upload_to_gcs(file_path, bucket_name=GCP_BUCKET_NAME):
+def upload_to_gcs(file_path, bucket_name=GCP_BUCKET_NAME, object_name=None):
     if not gcs_client:
         raise ValueError("GCS client is not initialized. Skipping file upload.")
 
     try:
         logger.info(f"Uploading file to Google Cloud Storage: {file_path}")
         bucket = gcs_client.bucket(bucket_name)
-        blob = bucket.blob(os.path.basename(file_path))
-        blob.upload_from_filename(file_path)
+        blob = bucket.blob(object_name or os.path.basename(file_path))
+        if os.path.getsize(file_path) >= GCS_PARALLEL_UPLOAD_THRESHOLD:
+            transfer_manager.upload_chunks_concurrently(
+                file_path,
+                blob,
+                chunk_size=GCS_UPLOAD_CHUNK_SIZE,
+                max_workers=GCS_UPLOAD_WORKERS,
+                worker_type=transfer_manager.THREAD
+            )
+        else:
+            blob.upload_from_filename(file_path)
         logger.info(f"File uploaded successfully to GCS: {blob.public_url}")
         return blob.public_url
     except Exception as e:
         logger.error(f"Error uploading file to GCS: {e}")
         raise
+
+def upload_stream_to_gcs(stream, object_name, bucket_name=GCP_BUCKET_NAME):
+    """Upload a non-seekable stream as a chunked resumable upload of unknown size.
+
+    The stream must implement tell(), which resumable uploads use to track the offset.
+    """
+    if not gcs_client:
+        raise ValueError("GCS client is not initialized. Skipping file upload.")
+
+    try:
+        logger.info(f"Streaming upload to Google Cloud Storage: {object_name}")
+        bucket = gcs_client.bucket(bucket_name)
+        blob = bucket.blob(object_name, chunk_size=UPLOAD_STREAM_CHUNK_SIZE)
+        blob.upload_from_file(stream)
+        logger.info(f"Stream uploaded successfully to GCS: {blob.public_url}")
+        return blob.public_url
+    except Exception as e:
+        logger.error(f"Error uploading stream to GCS: {e}")
+        raise
+
+def gcs_object_version(bucket_name, object_name):
+    """Generation of an object, which changes whenever it is overwritten."""
+    if not gcs_client:
+        raise ValueError("GCS client is not initialized. gs:// inputs need GCP_SA_CREDENTIALS.")
+    blob = gcs_client.bucket(bucket_name).get_blob(object_name)
+    if blob is None:
+        raise FileNotFoundError(f"gs://{bucket_name}/{object_name} not found")
+    return str(blob.generation)
+
+def download_from_gcs(bucket_name, object_name, file_path, generation, chunk_size, max_workers):
+    """Download one generation of an object with parallel ranged GETs of chunk_size bytes."""
+    if not gcs_client:
+        raise ValueError("GCS client is not initialized. gs:// inputs need GCP_SA_CREDENTIALS.")
+    # Pinning the generation keeps every range on the same version of the object
+    blob = gcs_client.bucket(bucket_name).blob(object_name, generation=int(generation))
+    blob.reload()
+    if blob.size < 2 * chunk_size or max_workers <= 1:
+        blob.download_to_filename(file_path)
+        return
+    transfer_manager.download_chunks_concurrently(
+        blob,
+        file_path,
+        chunk_size=chunk_size,
+        max_workers=max_workers,
+        worker_type=transfer_manager.THREAD
+    )
+
+def gcs_object_url(object_name, bucket_name=GCP_BUCKET_NAME):
+    """Public URL of an object if it already exists in the bucket, else None."""
+    if not gcs_client:
+        raise ValueError("GCS client is not initialized.")
+    blob = gcs_client.bucket(bucket_name).blob(object_name)
+    return blob.public_url if blob.exists() else None
@@ -0,0 +1,37 @@
+import os
+import logging
+import threading
+from apscheduler.schedulers.background import BackgroundScheduler
+from services.workspace import clean_orphaned_workspaces
+from services.file_management import delete_old_files
+from services.local_storage import expire_local_files
+
+logger = logging.getLogger(__name__)
+
+# Seconds between janitor runs
+JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 300))
+
+_scheduler = None
+_scheduler_pid = None
+_scheduler_lock = threading.Lock()
+
+def run_janitor():
+    """Reclaim disk left behind by killed jobs, old scratch files and expired local outputs."""
+    for task in (clean_orphaned_workspaces, delete_old_files, expire_local_files):
+        try:
+            task()
+        except Exception as e:
+            logger.error(f"Janitor task {task.__name__} failed: {e}")
+
+def start_janitor():
+    """Run the janitor now and then every JANITOR_INTERVAL seconds, once per process."""
+    global _scheduler, _scheduler_pid
+    with _scheduler_lock:
+        if _scheduler_pid == os.getpid():
+            return
+        run_janitor()
+        _scheduler = BackgroundScheduler(daemon=True)
+        # Every worker runs it; the tasks are idempotent, and coalescing skips runs missed while busy
+        _scheduler.add_job(run_janitor, 'interval', seconds=JANITOR_INTERVAL, coalesce=True, max_instances=1)
+        _scheduler.start()
+        _scheduler_pid = os.getpid()
@@ -0,0 +1,388 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# SQLite database shared by every gunicorn worker on this host
+JOB_QUEUE_DB = os.environ.get('JOB_QUEUE_DB', '/tmp/nca_job_queue.db')
+
+# Seconds an idle worker waits before polling the shared queue again
+JOB_QUEUE_POLL_INTERVAL = float(os.environ.get('JOB_QUEUE_POLL_INTERVAL', 0.5))
+
+# Seconds finished jobs stay available through the job status API
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 7 * 24 * 3600))
+
+# Times a job interrupted by a worker crash is re-enqueued before it is marked failed
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+
+# 'sjf' runs the job with the shortest predicted run time first, 'fifo' runs jobs in arrival order
+SCHEDULER_POLICY = os.environ.get('SCHEDULER_POLICY', 'sjf').lower()
+
+# Seconds of predicted run time a queued job is credited per second of waiting, so long jobs aren't starved
+SCHEDULER_AGING_FACTOR = float(os.environ.get('SCHEDULER_AGING_FACTOR', 1.0))
+
+# Columns added after the first release of the queue table
+JOB_COLUMNS = {
+    'mode': "TEXT NOT NULL DEFAULT 'queued'",
+    'endpoint': 'TEXT',
+    'attempts': 'INTEGER NOT NULL DEFAULT 0',
+    'finished_at': 'REAL',
+    'code': 'INTEGER',
+    'stages': 'TEXT',
+    'result': 'TEXT',
+    'output_urls': 'TEXT',
+    'cost': 'TEXT',
+    'est_seconds': 'REAL',
+    'request_hash': 'TEXT',
+    'processed_at': 'REAL',
+}
+
+# Queued view functions, registered by name so any worker can run any job
+_tasks = {}
+_local = threading.local()
+_current_job = threading.local()
+
+def register_task(f):
+    """Register a view function that can be run from the shared queue and return its task name."""
+    name = f"{f.__module__}.{f.__name__}"
+    _tasks[name] = f
+    return name
+
+def get_task(name):
+    return _tasks.get(name)
+
+def get_connection():
+    """Return a connection for the current thread, reopening it after a fork."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(JOB_QUEUE_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+def init_queue():
+    """Create the shared queue tables if they don't exist yet."""
+    conn = get_connection()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL UNIQUE,
+            task TEXT NOT NULL,
+            job_class TEXT NOT NULL,
+            data TEXT NOT NULL,
+            status TEXT NOT NULL,
+            queued_at REAL NOT NULL,
+            started_at REAL,
+            pid INTEGER
+        )
+    """)
+    existing = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+    for column, definition in JOB_COLUMNS.items():
+        if column not in existing:
+            conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_class ON jobs (status, job_class, seq)")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_queued_at ON jobs (queued_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_request_hash ON jobs (request_hash, seq)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS job_subscribers (
+            job_id TEXT NOT NULL,
+            webhook_url TEXT NOT NULL,
+            client_id TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS job_subscribers_job ON job_subscribers (job_id)")
+
+def pid_alive(pid):
+    """Check, at startup, whether the worker that claimed a row is still running."""
+    if not pid or pid == os.getpid():
+        # Our own pid on a row we haven't claimed yet belongs to a previous incarnation
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def recover_jobs():
+    """Re-enqueue jobs left running by a worker that died. Returns the number of recovered jobs."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute("SELECT job_id, mode, pid, attempts FROM jobs WHERE status = 'running'").fetchall()
+        recovered = 0
+        for row in rows:
+            if pid_alive(row['pid']):
+                continue
+            if row['mode'] == 'queued' and row['attempts'] < JOB_MAX_ATTEMPTS:
+                conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL, processed_at = NULL, pid = NULL WHERE job_id = ?", (row['job_id'],))
+                recovered += 1
+            else:
+                # Direct jobs have no caller left to answer, and repeated crashes mean the job itself is the problem
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, code = 500, result = ? WHERE job_id = ?",
+                    (time.time(), json.dumps({"message": "Worker died while processing the job"}), row['job_id'])
+                )
+        conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (time.time() - JOB_RETENTION,))
+        conn.execute("DELETE FROM job_subscribers WHERE created_at < ?", (time.time() - JOB_RETENTION,))
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if recovered:
+        logger.info(f"Re-enqueued {recovered} jobs interrupted by a worker restart")
+    return recovered
+
+def request_fingerprint(endpoint, data):
+    """Canonical hash of a request, ignoring the fields that only identify the caller."""
+    payload = {key: value for key, value in data.items() if key not in ('webhook_url', 'id')}
+    canonical = json.dumps({'endpoint': endpoint, 'payload': payload}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+def coalesce_job(request_hash, webhook_url, client_id, result_ttl):
+    """Find a job identical to a new request.
+
+    Returns (job_id, None) after subscribing webhook_url to an identical job that is still queued
+    or running, (job_id, result) for an identical job that succeeded less than result_ttl seconds
+    ago, and (None, None) when the request has to run.
+    """
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        row = conn.execute(
+            "SELECT job_id, status, result FROM jobs WHERE request_hash = ? "
+            "AND (status IN ('queued', 'running') OR (status = 'done' AND finished_at >= ?)) "
+            "ORDER BY seq DESC LIMIT 1",
+            (request_hash, time.time() - result_ttl)
+        ).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None, None
+        if row['status'] == 'done':
+            conn.execute('COMMIT')
+            return row['job_id'], json.loads(row['result'])
+        if not webhook_url:
+            # Without a webhook the caller can only get the result by running the request itself
+            conn.execute('COMMIT')
+            return None, None
+        conn.execute(
+            "INSERT INTO job_subscribers (job_id, webhook_url, client_id, created_at) VALUES (?, ?, ?, ?)",
+            (row['job_id'], webhook_url, client_id, time.time())
+        )
+        conn.execute('COMMIT')
+        return row['job_id'], None
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+def enqueue_job(job_id, task, job_class, data, queued_at, max_length=0, cost=None, request_hash=None):
+    """Append a job to the shared queue. Returns False if max_length queued jobs are already waiting."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if max_length > 0:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= max_length:
+                conn.execute('ROLLBACK')
+                return False
+        conn.execute(
+            "INSERT INTO jobs (job_id, task, job_class, data, status, queued_at, cost, est_seconds, request_hash) VALUES (?, ?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, task, job_class, json.dumps(data), queued_at, json.dumps(cost) if cost else None, cost.get('seconds') if cost else None, request_hash)
+        )
+        conn.execute('COMMIT')
+        return True
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+def job_priority(est_seconds, queued_at, now):
+    """Scheduling key of a queued job under SCHEDULER_POLICY; lower runs first."""
+    if SCHEDULER_POLICY != 'sjf':
+        return queued_at
+    return (est_seconds or 0) - (now - queued_at) * SCHEDULER_AGING_FACTOR
+
+def claim_job(job_class):
+    """Atomically take the next queued job of a class under SCHEDULER_POLICY, or return None if there is none."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if SCHEDULER_POLICY == 'sjf':
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND job_class = ? "
+                "ORDER BY COALESCE(est_seconds, 0) - (? - queued_at) * ?, seq LIMIT 1",
+                (job_class, time.time(), SCHEDULER_AGING_FACTOR)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND job_class = ? ORDER BY seq LIMIT 1",
+                (job_class,)
+            ).fetchone()
+        if row is None:
+            conn.execute('COMMIT')
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', started_at = ?, pid = ?, attempts = attempts + 1 WHERE seq = ?",
+            (time.time(), os.getpid(), row['seq'])
+        )
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+
+    job = dict(row)
+    job['data'] = json.loads(job['data'])
+    return job
+
+def start_direct_job(job_id, task, job_class, data, started_at, request_hash=None):
+    """Record a job that runs inside the HTTP request instead of going through the queue."""
+    get_connection().execute(
+        "INSERT INTO jobs (job_id, task, job_class, data, status, mode, queued_at, started_at, pid, attempts, request_hash) "
+        "VALUES (?, ?, ?, ?, 'running', 'direct', ?, ?, ?, 1, ?)",
+        (job_id, task, job_class, json.dumps(data), started_at, started_at, os.getpid(), request_hash)
+    )
+
+def release_job(job_id):
+    """Record when a job freed its slot; its outputs may still be uploading until finish_job()."""
+    get_connection().execute("UPDATE jobs SET processed_at = ? WHERE job_id = ?", (time.time(), job_id))
+
+def finish_job(job_id, response_data, stages=None):
+    """Store the outcome of a job and keep it for JOB_RETENTION seconds.
+
+    Returns the webhook subscribers of identical requests that were attached to this job.
+    """
+    code = response_data.get('code')
+    status = 'done' if code == 200 else 'failed'
+    now = time.time()
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, processed_at = COALESCE(processed_at, ?), endpoint = ?, code = ?, "
+            "stages = ?, result = ?, output_urls = ? WHERE job_id = ?",
+            (
+                status,
+                now,
+                now,
+                response_data.get('endpoint'),
+                code,
+                json.dumps(stages or {}),
+                json.dumps(response_data, default=str),
+                json.dumps(find_output_urls(response_data.get('response'))),
+                job_id
+            )
+        )
+        subscribers = conn.execute("SELECT webhook_url, client_id FROM job_subscribers WHERE job_id = ?", (job_id,)).fetchall()
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return [dict(row) for row in subscribers]
+
+def find_output_urls(value):
+    """Collect every URL found in a job response, in order."""
+    if isinstance(value, str):
+        return [value] if value.startswith(('http://', 'https://')) else []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple)):
+        return [url for item in value for url in find_output_urls(item)]
+    return []
+
+def _job_from_row(row):
+    job = dict(row)
+    result = json.loads(job.pop('result') or 'null') or {}
+    for column, default in (('data', {}), ('stages', {}), ('output_urls', []), ('cost', None)):
+        job[column] = json.loads(job[column]) if job[column] else default
+    job['id'] = job['data'].get('id')
+    job['response'] = result.get('response')
+    job['message'] = result.get('message')
+    if job['started_at']:
+        job['queue_time'] = round(job['started_at'] - job['queued_at'], 3)
+    if job['finished_at']:
+        job['run_time'] = round(job['finished_at'] - (job['started_at'] or job['queued_at']), 3)
+        job['total_time'] = round(job['finished_at'] - job['queued_at'], 3)
+    del job['seq']
+    return job
+
+def get_job(job_id):
+    """Return a stored job with its state, timings and result, or None."""
+    row = get_connection().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _job_from_row(row) if row else None
+
+def list_jobs(job_ids=None, status=None, since=None, limit=100):
+    """Return stored jobs, newest first, optionally filtered by ids, status and queue time."""
+    query = "SELECT * FROM jobs WHERE 1 = 1"
+    params = []
+    if job_ids:
+        query += f" AND job_id IN ({', '.join('?' for _ in job_ids)})"
+        params.extend(job_ids)
+    if status:
+        query += " AND status = ?"
+        params.append(status)
+    if since:
+        query += " AND queued_at >= ?"
+        params.append(since)
+    query += " ORDER BY seq DESC LIMIT ?"
+    params.append(limit)
+    return [_job_from_row(row) for row in get_connection().execute(query, params)]
+
+def begin_stages():
+    """Start collecting stage timings for the job running on this thread."""
+    _current_job.stages = {}
+
+def end_stages():
+    """Return the stage timings collected on this thread since begin_stages()."""
+    stages = getattr(_current_job, 'stages', None) or {}
+    _current_job.stages = None
+    return {name: round(seconds, 3) for name, seconds in stages.items()}
+
+@contextmanager
+def job_stage(name):
+    """Time a stage (download, encode, upload...) of the job running on this thread."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        add_stage_time(name, time.time() - start)
+
+def add_stage_time(name, seconds):
+    stages = getattr(_current_job, 'stages', None)
+    if stages is not None:
+        stages[name] = stages.get(name, 0) + seconds
+
+def active_jobs():
+    """Class, status, timestamps and estimated cost of every queued or running job."""
+    rows = get_connection().execute(
+        "SELECT job_id, job_class, status, queued_at, started_at, cost FROM jobs WHERE status IN ('queued', 'running')"
+    ).fetchall()
+    return [dict(row, cost=json.loads(row['cost']) if row['cost'] else {}) for row in rows]
+
+def finished_job_costs(limit=2000):
+    """Estimated cost and measured run time of the most recent successful jobs, newest first.
+
+    The run time ends when the job released its slot, so deferred uploads aren't counted.
+    """
+    rows = get_connection().execute(
+        "SELECT cost, COALESCE(processed_at, finished_at) - started_at AS run_time FROM jobs "
+        "WHERE status = 'done' AND cost IS NOT NULL AND started_at IS NOT NULL ORDER BY seq DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    return [(json.loads(row['cost']), row['run_time']) for row in rows]
+
+def queue_length(job_class=None):
+    """Number of jobs waiting in the shared queue, across all workers."""
+    conn = get_connection()
+    if job_class:
+        return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND job_class = ?", (job_class,)).fetchone()[0]
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
@@ -0,0 +1,87 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Directory served by nginx, and the URL it is served under (e.g. http://localhost:8080/nca-files)
+LOCAL_STORAGE_PATH = os.environ.get('LOCAL_STORAGE_PATH', '/tmp/nca_storage')
+LOCAL_STORAGE_BASE_URL = os.environ.get('LOCAL_STORAGE_BASE_URL', '')
+
+# Seconds a stored file is served before the janitor removes it
+LOCAL_STORAGE_TTL = float(os.environ.get('LOCAL_STORAGE_TTL', 24 * 3600))
+
+CHUNK_SIZE = 1024 * 1024
+
+def local_url(object_name):
+    return f"{LOCAL_STORAGE_BASE_URL.rstrip('/')}/{object_name}"
+
+def store_local(file_path, object_name=None):
+    """Publish a file in the served directory without copying it, and return its URL.
+
+    The file is hardlinked (copied only across filesystems), so the caller can still delete its own path.
+    """
+    os.makedirs(LOCAL_STORAGE_PATH, exist_ok=True)
+    object_name = object_name or os.path.basename(file_path)
+    destination = os.path.join(LOCAL_STORAGE_PATH, object_name)
+    temp_path = os.path.join(LOCAL_STORAGE_PATH, f".{uuid.uuid4()}.tmp")
+    try:
+        os.link(file_path, temp_path)
+    except OSError:
+        shutil.copyfile(file_path, temp_path)
+    os.chmod(temp_path, 0o644)
+    # The expiry clock starts when the file is published
+    os.utime(temp_path)
+    os.replace(temp_path, destination)
+    return local_url(object_name)
+
+def store_local_stream(stream, object_name):
+    """Write a stream into the served directory and return its URL; readers never see a partial file."""
+    os.makedirs(LOCAL_STORAGE_PATH, exist_ok=True)
+    temp_path = os.path.join(LOCAL_STORAGE_PATH, f".{uuid.uuid4()}.tmp")
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                f.write(chunk)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, os.path.join(LOCAL_STORAGE_PATH, object_name))
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return local_url(object_name)
+
+def local_object_url(object_name):
+    """URL of a stored file that hasn't expired yet, else None.
+
+    The file's expiry restarts, since its URL is about to be handed out again.
+    """
+    path = os.path.join(LOCAL_STORAGE_PATH, object_name)
+    try:
+        if not os.path.isfile(path) or time.time() - os.path.getmtime(path) >= LOCAL_STORAGE_TTL:
+            return None
+        os.utime(path)
+    except FileNotFoundError:
+        # Expired by the janitor in the meantime
+        return None
+    return local_url(object_name)
+
+def expire_local_files():
+    """Remove stored files older than LOCAL_STORAGE_TTL."""
+    if not os.path.isdir(LOCAL_STORAGE_PATH):
+        return 0
+    cutoff = time.time() - LOCAL_STORAGE_TTL
+    removed = 0
+    for entry in os.scandir(LOCAL_STORAGE_PATH):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            # Another worker removed it first
+            pass
+    if removed:
+        logger.info(f"Expired {removed} files from local storage")
+    return removed
@@ -0,0 +1,82 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from services.audio_pcm import SAMPLE_RATE, PcmSlice, load_pcm
+from services.vad import VAD_THRESHOLD_DB, VAD_MIN_SILENCE, speech_regions, plan_chunks
+from services.whisper_models import transcribe
+from services.transcription_client import server_available
+from services.job_queue import job_stage
+
+logger = logging.getLogger(__name__)
+
+# Longest chunk sent to one transcription process
+LONG_MEDIA_CHUNK_SECONDS = float(os.environ.get('LONG_MEDIA_CHUNK_SECONDS', 180))
+
+# Silences longer than this end a chunk and are skipped
+LONG_MEDIA_MAX_GAP_SECONDS = float(os.environ.get('LONG_MEDIA_MAX_GAP_SECONDS', 2))
+
+# Chunks transcribed at the same time (0 = one per transcription server process)
+LONG_MEDIA_CONCURRENCY = int(os.environ.get('LONG_MEDIA_CONCURRENCY', 0)) or int(os.environ.get('TRANSCRIBE_PROCESSES', 2))
+
+# Whisper's seek field counts mel frames, 100 per second
+FRAMES_PER_SECOND = 100
+
+def chunking_mode():
+    """The settings that shape a long media transcript, so results made with other settings aren't mixed up with it."""
+    return f"long:chunk={LONG_MEDIA_CHUNK_SECONDS:g},gap={LONG_MEDIA_MAX_GAP_SECONDS:g},vad={VAD_THRESHOLD_DB:g}/{VAD_MIN_SILENCE:g}"
+
+def _shift(result, start_sample, first_id):
+    """Segments of a chunk's result moved to the chunk's position in the whole media."""
+    offset = start_sample / SAMPLE_RATE
+    segments = []
+    for i, segment in enumerate(result['segments']):
+        segment = dict(segment, id=first_id + i, start=segment['start'] + offset, end=segment['end'] + offset)
+        segment['seek'] = segment.get('seek', 0) + int(offset * FRAMES_PER_SECOND)
+        if segment.get('words'):
+            segment['words'] = [dict(word, start=word['start'] + offset, end=word['end'] + offset) for word in segment['words']]
+        segments.append(segment)
+    return segments
+
+def transcribe_long_media(model_size, pcm_path, backend=None, **options):
+    """Transcribe long media as speech chunks cut at silences, in parallel across the transcription processes.
+
+    pcm_path holds the decoded audio (see extract_audio). Voice activity detection finds the speech,
+    and chunks of up to LONG_MEDIA_CHUNK_SECONDS are transcribed concurrently. Their segments and word
+    timestamps are shifted back to media time and stitched into one result with the same schema as a
+    single pass.
+    """
+    samples = load_pcm(pcm_path)
+    with job_stage('vad'):
+        chunks = plan_chunks(
+            speech_regions(samples),
+            int(LONG_MEDIA_CHUNK_SECONDS * SAMPLE_RATE),
+            int(LONG_MEDIA_MAX_GAP_SECONDS * SAMPLE_RATE)
+        )
+    speech_seconds = sum(end - start for start, end in chunks) / SAMPLE_RATE
+    logger.info(
+        f"Long media mode: {len(samples) / SAMPLE_RATE:.0f}s of audio, "
+        f"{speech_seconds:.0f}s of speech in {len(chunks)} chunks"
+    )
+    if not chunks:
+        return {'text': '', 'segments': [], 'language': options.get('language'), 'backend': backend}
+
+    start_time = time.time()
+    slices = [PcmSlice(pcm_path, start, end) for start, end in chunks]
+    # Without a language, detect it on the first chunk and use it for the rest so chunks agree
+    first = transcribe(model_size, slices[0], backend, **options)
+    options = dict(options, language=options.get('language') or first.get('language'))
+    workers = LONG_MEDIA_CONCURRENCY if server_available() else 1
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        rest = list(executor.map(lambda audio: transcribe(model_size, audio, backend, **options), slices[1:]))
+    logger.info(f"Transcribed {len(chunks)} chunks in {time.time() - start_time:.1f}s with {workers} workers")
+
+    segments = []
+    for (start, _), result in zip(chunks, [first] + rest):
+        segments.extend(_shift(result, start, len(segments)))
+    return {
+        'text': ''.join(segment['text'] for segment in segments),
+        'segments': segments,
+        'language': options['language'],
+        'backend': first['backend'],
+    }
@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from services.job_queue import active_jobs, finished_job_costs, job_priority
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs an endpoint needs before its learned model replaces the static estimate
+RUNTIME_MODEL_MIN_SAMPLES = int(os.environ.get('RUNTIME_MODEL_MIN_SAMPLES', 5))
+
+# Most recent finished jobs used per endpoint
+RUNTIME_MODEL_MAX_SAMPLES = int(os.environ.get('RUNTIME_MODEL_MAX_SAMPLES', 200))
+
+# Seconds a fitted model is reused before it is refitted from the job history
+RUNTIME_MODEL_REFRESH = float(os.environ.get('RUNTIME_MODEL_REFRESH', 60))
+
+_models = {}
+_fitted_at = 0
+_lock = threading.Lock()
+
+def _model_key(features):
+    # Whisper run time scales with the model and engine, so each model size and backend is learned separately
+    return features.get('endpoint'), features.get('model_size'), features.get('backend')
+
+def _regressors(features):
+    """Inputs of the run time model: intercept, media seconds, resolution-weighted media seconds, outputs."""
+    duration = features.get('duration', 0)
+    resolution_factor = features.get('pixels', 1920 * 1080) / (1920 * 1080)
+    return [1.0, duration, duration * resolution_factor, features.get('output_count', 1)]
+
+def _fit():
+    """Least-squares fit of run time against the job features, per endpoint, model size and backend."""
+    samples = {}
+    for cost, run_time in finished_job_costs():
+        features = cost.get('features')
+        if not features or run_time is None:
+            continue
+        rows = samples.setdefault(_model_key(features), [])
+        if len(rows) < RUNTIME_MODEL_MAX_SAMPLES:
+            rows.append((_regressors(features), run_time))
+
+    models = {}
+    for key, rows in samples.items():
+        if len(rows) < RUNTIME_MODEL_MIN_SAMPLES:
+            continue
+        x = np.array([row[0] for row in rows])
+        y = np.array([row[1] for row in rows])
+        coefficients, _, _, _ = np.linalg.lstsq(x, y, rcond=None)
+        models[key] = {"coefficients": coefficients, "samples": len(rows)}
+    return models
+
+def _get_models():
+    global _models, _fitted_at
+    with _lock:
+        if time.time() - _fitted_at > RUNTIME_MODEL_REFRESH:
+            try:
+                _models = _fit()
+            except Exception as e:
+                logger.error(f"Failed to fit run time model: {e}")
+            _fitted_at = time.time()
+        return _models
+
+def predict_run_time(features, fallback_seconds):
+    """Predicted run time in seconds, learned from past jobs of the same endpoint, or fallback_seconds."""
+    model = _get_models().get(_model_key(features))
+    if model is None:
+        return fallback_seconds
+    prediction = float(np.dot(model["coefficients"], _regressors(features)))
+    # A fit on few or noisy samples can extrapolate below zero
+    return round(max(prediction, 1.0), 3)
+
+def estimate_schedule(job_id, job_class, slots, est_seconds, queued_at):
+    """Estimated (start, completion) unix times of a queued job, from the jobs that will run before it."""
+    now = time.time()
+    own_priority = job_priority(est_seconds, queued_at, now)
+    ahead = 0
+    for job in active_jobs():
+        if job['job_class'] != job_class or job['job_id'] == job_id:
+            continue
+        seconds = job['cost'].get('seconds', 0)
+        if job['status'] == 'running':
+            ahead += max(seconds - (now - (job['started_at'] or now)), 0)
+        elif job_priority(seconds, job['queued_at'], now) <= own_priority:
+            ahead += seconds
+    start = now + ahead / max(slots, 1)
+    return round(start, 3), round(start + est_seconds, 3)
@@ -1,10 +1,44 @@
 import os
 import boto3
 import logging
+import threading
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
+MB = 1024 * 1024
+
+# Files above the threshold are sent as a multipart upload of S3_MULTIPART_CHUNK_MB parts,
+# S3_MAX_CONCURRENCY parts at a time
+S3_MULTIPART_THRESHOLD = int(float(os.environ.get('S3_MULTIPART_THRESHOLD_MB', 16)) * MB)
+S3_MULTIPART_CHUNK_SIZE = int(float(os.environ.get('S3_MULTIPART_CHUNK_MB', 16)) * MB)
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', 8))
+
+# HTTP connections kept open per client, shared by every upload in the process
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', 32))
+
+# Part size and parallel parts for streamed uploads; together they bound the memory held per upload
+UPLOAD_STREAM_CHUNK_SIZE = int(float(os.environ.get('UPLOAD_STREAM_CHUNK_MB', 8)) * MB)
+UPLOAD_STREAM_CONCURRENCY = int(os.environ.get('UPLOAD_STREAM_CONCURRENCY', 4))
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_CHUNK_SIZE,
+    max_concurrency=S3_MAX_CONCURRENCY
+)
+
+STREAM_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=UPLOAD_STREAM_CHUNK_SIZE,
+    multipart_chunksize=UPLOAD_STREAM_CHUNK_SIZE,
+    max_concurrency=UPLOAD_STREAM_CONCURRENCY
+)
+
+_clients = {}
+_clients_lock = threading.Lock()
+
 def parse_s3_url(s3_url):
     """Parse S3 URL to extract bucket name, region, and endpoint URL."""
     parsed_url = urlparse(s3_url)
@@ -20,25 +54,85 @@ def parse_s3_url(s3_url):
     
     return bucket_name, region, endpoint_url
 
-def upload_to_s3(file_path, s3_url, access_key, secret_key):
-    # Parse the S3 URL into bucket, region, and endpoint
+def get_s3_client(s3_url, access_key, secret_key):
+    """Return (client, bucket name, endpoint URL) for an S3 URL.
+
+    Clients are created once per process and credentials, and are shared by all threads
+    (boto3 clients are thread-safe, sessions are not).
+    """
     bucket_name, region, endpoint_url = parse_s3_url(s3_url)
-    
-    session = boto3.Session(
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=region
+    key = (os.getpid(), endpoint_url, region, access_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            session = boto3.Session(
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name=region
+            )
+            client = session.client('s3', endpoint_url=endpoint_url, config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS))
+            _clients[key] = client
+    return client, bucket_name, endpoint_url
+
+def get_input_client():
+    """Client for reading s3:// inputs, with the credentials configured for uploads."""
+    s3_url = os.environ.get('S3_ENDPOINT_URL')
+    access_key = os.environ.get('S3_ACCESS_KEY')
+    secret_key = os.environ.get('S3_SECRET_KEY')
+    if not (s3_url and access_key and secret_key):
+        raise ValueError("s3:// inputs need S3_ENDPOINT_URL, S3_ACCESS_KEY and S3_SECRET_KEY")
+    client, _, _ = get_s3_client(s3_url, access_key, secret_key)
+    return client
+
+def s3_object_version(bucket_name, object_name):
+    """ETag of an object, read with a HEAD request."""
+    return get_input_client().head_object(Bucket=bucket_name, Key=object_name)['ETag']
+
+def download_from_s3(bucket_name, object_name, file_path, chunk_size, max_concurrency, callback=None):
+    """Download an object with parallel ranged GETs of chunk_size bytes.
+
+    callback is called with the bytes received after each chunk; raising from it stops the transfer.
+    """
+    config = TransferConfig(
+        multipart_threshold=2 * chunk_size,
+        multipart_chunksize=chunk_size,
+        max_concurrency=max_concurrency
     )
-    
-    client = session.client('s3', endpoint_url=endpoint_url)
+    get_input_client().download_file(bucket_name, object_name, file_path, Config=config, Callback=callback)
+
+def upload_to_s3(file_path, s3_url, access_key, secret_key, object_name=None):
+    client, bucket_name, endpoint_url = get_s3_client(s3_url, access_key, secret_key)
+    object_name = object_name or os.path.basename(file_path)
 
     try:
-        # Upload the file to the specified S3 bucket
-        with open(file_path, 'rb') as data:
-            client.upload_fileobj(data, bucket_name, os.path.basename(file_path), ExtraArgs={'ACL': 'public-read'})
+        # Upload the file to the specified S3 bucket, in parallel parts when it is large
+        client.upload_file(file_path, bucket_name, object_name, ExtraArgs={'ACL': 'public-read'}, Config=TRANSFER_CONFIG)
 
-        file_url = f"{endpoint_url}/{bucket_name}/{os.path.basename(file_path)}"
+        file_url = f"{endpoint_url}/{bucket_name}/{object_name}"
         return file_url
     except Exception as e:
         logger.error(f"Error uploading file to S3: {e}")
         raise
+
+def upload_stream_to_s3(stream, object_name, s3_url, access_key, secret_key):
+    """Upload a non-seekable stream as a multipart upload, holding at most a few parts in memory."""
+    client, bucket_name, endpoint_url = get_s3_client(s3_url, access_key, secret_key)
+
+    try:
+        # An exception raised while reading the stream aborts the multipart upload
+        client.upload_fileobj(stream, bucket_name, object_name, ExtraArgs={'ACL': 'public-read'}, Config=STREAM_TRANSFER_CONFIG)
+        return f"{endpoint_url}/{bucket_name}/{object_name}"
+    except Exception as e:
+        logger.error(f"Error uploading stream to S3: {e}")
+        raise
+
+def s3_object_url(object_name, s3_url, access_key, secret_key):
+    """URL of an object if it already exists in the bucket (checked with a HEAD request), else None."""
+    client, bucket_name, endpoint_url = get_s3_client(s3_url, access_key, secret_key)
+    try:
+        client.head_object(Bucket=bucket_name, Key=object_name)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return f"{endpoint_url}/{bucket_name}/{object_name}"
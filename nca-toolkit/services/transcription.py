@@ -1,9 +1,10 @@
 import os
-import whisper
 import srt
 from datetime import timedelta
 from whisper.utils import WriteSRT, WriteVTT
 from services.file_management import download_file
+from services.workspace import workspace_dir
+from services.transcription_cache import transcribe_media
 import logging
 import uuid
 
@@ -11,29 +12,23 @@ import uuid
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Set the default local storage directory
-STORAGE_PATH = "/tmp/"
-
 def process_transcription(media_url, output_type, max_chars=56, language=None,):
     """Transcribe media and return the transcript, SRT or ASS file path."""
     logger.info(f"Starting transcription for media URL: {media_url} with output type: {output_type}")
-    input_filename = download_file(media_url, os.path.join(STORAGE_PATH, 'input_media'))
+    input_filename = download_file(media_url, workspace_dir())
     logger.info(f"Downloaded media to local file: {input_filename}")
 
     try:
-        model = whisper.load_model("base")
-        logger.info("Loaded Whisper model")
-
         # result = model.transcribe(input_filename)
         # logger.info("Transcription completed")
 
         if output_type == 'transcript':
-            result = model.transcribe(input_filename, language=language)
+            result = transcribe_media("base", input_filename, language=language)
             output = result['text']
             logger.info("Generated transcript output")
         elif output_type in ['srt', 'vtt']:
 
-            result = model.transcribe(input_filename)
+            result = transcribe_media("base", input_filename)
             srt_subtitles = []
             for i, segment in enumerate(result['segments'], start=1):
                 start = timedelta(seconds=segment['start'])
@@ -44,7 +39,7 @@ def process_transcription(media_url, output_type, max_chars=56, language=None,):
             output_content = srt.compose(srt_subtitles)
             
             # Write the output to a file
-            output_filename = os.path.join(STORAGE_PATH, f"{uuid.uuid4()}.{output_type}")
+            output_filename = os.path.join(workspace_dir(), f"{uuid.uuid4()}.{output_type}")
             with open(output_filename, 'w') as f:
                 f.write(output_content)
             
@@ -52,7 +47,8 @@ def process_transcription(media_url, output_type, max_chars=56, language=None,):
             logger.info(f"Generated {output_type.upper()} output: {output}")
 
         elif output_type == 'ass':
-            result = model.transcribe(
+            result = transcribe_media(
+                "base",
                 input_filename,
                 word_timestamps=True,
                 task='transcribe',
@@ -66,7 +62,7 @@ def process_transcription(media_url, output_type, max_chars=56, language=None,):
             output_content = ass_content
 
             # Write the ASS content to a file
-            output_filename = os.path.join(STORAGE_PATH, f"{uuid.uuid4()}.{output_type}")
+            output_filename = os.path.join(workspace_dir(), f"{uuid.uuid4()}.{output_type}")
             with open(output_filename, 'w') as f:
                f.write(output_content) 
             output = output_filename
@@ -0,0 +1,121 @@
+import os
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# Engine used when a request doesn't pick one: 'openai-whisper' or 'faster-whisper'
+TRANSCRIBE_BACKEND = os.environ.get('TRANSCRIBE_BACKEND', 'openai-whisper')
+
+# Where model checkpoints are downloaded to (each engine's default cache when unset)
+WHISPER_MODEL_DIR = os.environ.get('WHISPER_MODEL_DIR') or None
+
+# CTranslate2 weight type for faster-whisper: int8 is the fastest on CPUs without a GPU
+FASTER_WHISPER_COMPUTE_TYPE = os.environ.get('FASTER_WHISPER_COMPUTE_TYPE', 'int8')
+
+# Approximate parameter count of each Whisper size, for engines that don't expose their weights
+MODEL_PARAMETERS = {
+    'tiny': 39e6,
+    'base': 74e6,
+    'small': 244e6,
+    'medium': 769e6,
+    'large': 1550e6,
+}
+
+BYTES_PER_WEIGHT = {'int8': 1, 'int8_float16': 1, 'int16': 2, 'float16': 2, 'float32': 4}
+
+# Transcription options understood by every backend
+COMMON_OPTIONS = ('language', 'task', 'word_timestamps', 'initial_prompt', 'temperature')
+
+class TranscriptionBackend(ABC):
+    # Whether a loaded model keeps working in a child forked after loading it
+    fork_safe = True
+
+    @abstractmethod
+    def load(self, model_size):
+        """Load a model of the given size."""
+        pass
+
+    @abstractmethod
+    def memory(self, model, model_size):
+        """Bytes of RAM the loaded model takes."""
+        pass
+
+    @abstractmethod
+    def transcribe(self, model, audio, **options):
+        """Transcribe audio (a file path) into openai-whisper's result schema: text, segments and language."""
+        pass
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """openai-whisper in PyTorch, float32 on CPU."""
+    def load(self, model_size):
+        import whisper
+        return whisper.load_model(model_size, download_root=WHISPER_MODEL_DIR)
+
+    def memory(self, model, model_size):
+        return sum(p.numel() * p.element_size() for p in model.parameters())
+
+    def transcribe(self, model, audio, **options):
+        return model.transcribe(audio, **options)
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """faster-whisper (CTranslate2) with quantized weights, installed separately: pip install faster-whisper."""
+    # CTranslate2 starts its worker threads when a model is loaded, and forked children don't inherit them
+    fork_safe = False
+
+    def load(self, model_size):
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError:
+            raise ValueError("The faster-whisper backend needs the faster-whisper package (pip install faster-whisper)")
+        return WhisperModel(
+            model_size,
+            device='cpu',
+            compute_type=FASTER_WHISPER_COMPUTE_TYPE,
+            cpu_threads=int(os.environ.get('TRANSCRIBE_TORCH_THREADS', 0)),
+            download_root=WHISPER_MODEL_DIR
+        )
+
+    def memory(self, model, model_size):
+        return int(MODEL_PARAMETERS.get(model_size, MODEL_PARAMETERS['large']) * BYTES_PER_WEIGHT.get(FASTER_WHISPER_COMPUTE_TYPE, 4))
+
+    def transcribe(self, model, audio, **options):
+        kwargs = {name: options[name] for name in COMMON_OPTIONS if options.get(name) is not None}
+        segments, info = model.transcribe(audio, **kwargs)
+        result_segments = []
+        for segment in segments:
+            result_segment = {
+                'id': segment.id,
+                'seek': segment.seek,
+                'start': segment.start,
+                'end': segment.end,
+                'text': segment.text,
+                'tokens': list(segment.tokens),
+                'temperature': segment.temperature,
+                'avg_logprob': segment.avg_logprob,
+                'compression_ratio': segment.compression_ratio,
+                'no_speech_prob': segment.no_speech_prob,
+            }
+            if segment.words is not None:
+                result_segment['words'] = [
+                    {'word': word.word, 'start': word.start, 'end': word.end, 'probability': word.probability}
+                    for word in segment.words
+                ]
+            result_segments.append(result_segment)
+        return {
+            'text': ''.join(segment['text'] for segment in result_segments),
+            'segments': result_segments,
+            'language': info.language,
+        }
+
+BACKENDS = {
+    'openai-whisper': OpenAIWhisperBackend(),
+    'faster-whisper': FasterWhisperBackend(),
+}
+
+def get_backend(name=None):
+    """Backend by name, TRANSCRIBE_BACKEND by default. Returns (name, backend)."""
+    name = name or TRANSCRIBE_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name}. Must be one of: {', '.join(BACKENDS)}")
+    return name, BACKENDS[name]
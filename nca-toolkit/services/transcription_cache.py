@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import zlib
+import logging
+import threading
+from services.audio_pcm import PcmSlice, extract_audio, load_pcm, pcm_hash
+from services.transcription_backends import get_backend
+from services.whisper_models import transcribe
+from services.long_media import chunking_mode, transcribe_long_media
+from services.job_queue import get_connection
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 ** 2
+
+# Set to 'false' to transcribe every request from scratch
+TRANSCRIPTION_CACHE = os.environ.get('TRANSCRIPTION_CACHE', 'true').lower() == 'true'
+
+# Compressed bytes of cached results kept before the least recently used ones are evicted
+TRANSCRIPTION_CACHE_MAX_BYTES = float(os.environ.get('TRANSCRIPTION_CACHE_MAX_MB', 1024)) * MB
+
+# Options that only change what is logged, not the result
+IGNORED_OPTIONS = ('verbose',)
+
+_initialized_pid = None
+_init_lock = threading.Lock()
+
+def _init_cache():
+    """Create the index table once per process."""
+    global _initialized_pid
+    with _init_lock:
+        if _initialized_pid == os.getpid():
+            return
+        conn = get_connection()
+        # Tables from before results were keyed by mode only hold results that can't be told apart; start over
+        columns = [row['name'] for row in conn.execute("PRAGMA table_info(transcription_cache)")]
+        if columns and 'mode' not in columns:
+            conn.execute("DROP TABLE transcription_cache")
+        # language is '' for auto-detection; detected_language is what the model found.
+        # mode is 'single' for one pass, or the chunking settings of a long media transcript.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS transcription_cache (
+                audio_hash TEXT NOT NULL,
+                model_size TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                task TEXT NOT NULL,
+                language TEXT NOT NULL,
+                word_timestamps INTEGER NOT NULL,
+                options TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                detected_language TEXT,
+                result BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (audio_hash, model_size, backend, task, language, word_timestamps, options, mode)
+            )
+        """)
+        _initialized_pid = os.getpid()
+
+def _cache_key(audio_hash, model_size, backend, long_media, options):
+    """Index columns of a request: the result depends on the audio, model, task, language, word timestamps
+    and whether it was transcribed in one pass or as long media chunks."""
+    extra = {
+        name: value for name, value in options.items()
+        if name not in ('task', 'language', 'word_timestamps') + IGNORED_OPTIONS and value is not None
+    }
+    return (
+        audio_hash,
+        model_size,
+        get_backend(backend)[0],
+        options.get('task') or 'transcribe',
+        options.get('language') or '',
+        1 if options.get('word_timestamps') else 0,
+        json.dumps(extra, sort_keys=True),
+        chunking_mode() if long_media else 'single',
+    )
+
+def _without_words(result):
+    return dict(result, segments=[
+        {name: value for name, value in segment.items() if name != 'words'} for segment in result['segments']
+    ])
+
+def lookup(key):
+    """Cached result for a request, or None.
+
+    A result with word timestamps also answers the same request without them, and an auto-detected
+    result answers requests that name the language it found.
+    """
+    _init_cache()
+    audio_hash, model_size, backend, task, language, word_timestamps, options, mode = key
+    rows = get_connection().execute(
+        """
+        SELECT rowid, * FROM transcription_cache
+        WHERE audio_hash = ? AND model_size = ? AND backend = ? AND task = ? AND options = ? AND mode = ?
+            AND word_timestamps >= ?
+        ORDER BY word_timestamps = ? DESC, language = ? DESC
+        """,
+        (audio_hash, model_size, backend, task, options, mode, word_timestamps, word_timestamps, language)
+    ).fetchall()
+    for row in rows:
+        if row['language'] == language or (language and not row['language'] and row['detected_language'] == language):
+            break
+    else:
+        return None
+
+    get_connection().execute("UPDATE transcription_cache SET last_used = ? WHERE rowid = ?", (time.time(), row['rowid']))
+    result = json.loads(zlib.decompress(row['result']))
+    if row['word_timestamps'] and not word_timestamps:
+        result = _without_words(result)
+    return result
+
+def store(key, result):
+    """Index a result under its request, then evict beyond TRANSCRIPTION_CACHE_MAX_BYTES."""
+    _init_cache()
+    blob = zlib.compress(json.dumps(result).encode())
+    conn = get_connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO transcription_cache "
+        "(audio_hash, model_size, backend, task, language, word_timestamps, options, mode, detected_language, result, size, last_used) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        key + (result.get('language'), blob, len(blob), time.time())
+    )
+    evict()
+
+def evict():
+    """Remove least recently used results until the cache fits in TRANSCRIPTION_CACHE_MAX_BYTES."""
+    conn = get_connection()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        rows = conn.execute("SELECT rowid, size FROM transcription_cache ORDER BY last_used DESC").fetchall()
+        total = 0
+        evicted = []
+        for row in rows:
+            total += row['size']
+            if total > TRANSCRIPTION_CACHE_MAX_BYTES:
+                evicted.append(row['rowid'])
+        conn.executemany("DELETE FROM transcription_cache WHERE rowid = ?", [(rowid,) for rowid in evicted])
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    if evicted:
+        logger.info(f"Evicted {len(evicted)} results from the transcription cache")
+
+def transcribe_media(model_size, media_path, backend=None, long_media=False, **options):
+    """Transcribe a media file, reusing an earlier result for the same audio, model and options.
+
+    The audio is decoded to PCM first (see extract_audio) and hashed, so the same recording matches
+    whatever container or URL it arrives in. The engine then gets the decoded samples instead of
+    decoding the file again.
+    """
+    pcm_path = extract_audio(media_path)
+    key = None
+    if TRANSCRIPTION_CACHE:
+        key = _cache_key(pcm_hash(pcm_path), model_size, backend, long_media, options)
+        result = lookup(key)
+        if result is not None:
+            logger.info(f"Transcription cache hit for {os.path.basename(media_path)} ({model_size}, {key[2]})")
+            return result
+
+    if long_media:
+        result = transcribe_long_media(model_size, pcm_path, backend, **options)
+    else:
+        result = transcribe(model_size, PcmSlice(pcm_path, 0, len(load_pcm(pcm_path))), backend, **options)
+
+    if key is not None:
+        try:
+            store(key, result)
+        except Exception as e:
+            logger.warning(f"Failed to cache transcription: {e}")
+    return result
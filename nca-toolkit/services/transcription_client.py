@@ -0,0 +1,54 @@
+import os
+import socket
+import logging
+from multiprocessing.connection import Client
+
+logger = logging.getLogger(__name__)
+
+# Set to 'false' to always transcribe inside the gunicorn worker
+TRANSCRIBE_SERVER = os.environ.get('TRANSCRIBE_SERVER', 'true').lower() == 'true'
+
+# Unix socket the transcription server (services/transcription_server.py) listens on
+TRANSCRIBE_SERVER_SOCKET = os.environ.get('TRANSCRIBE_SERVER_SOCKET', '/tmp/nca_transcribe.sock')
+
+class TranscriptionServerUnavailable(Exception):
+    pass
+
+def authkey():
+    """Key both ends authenticate the connection with, so only the toolkit can use the socket."""
+    return os.environ.get('API_KEY', 'nca-toolkit').encode()
+
+def server_available():
+    return TRANSCRIBE_SERVER and os.path.exists(TRANSCRIBE_SERVER_SOCKET)
+
+def _request(request):
+    try:
+        conn = Client(TRANSCRIBE_SERVER_SOCKET, family='AF_UNIX', authkey=authkey())
+    except (OSError, EOFError) as e:
+        raise TranscriptionServerUnavailable(f"Could not connect to the transcription server: {e}")
+    with conn:
+        conn.send(request)
+        # Waits for as long as the transcription takes; the server answers on this connection
+        try:
+            status, value = conn.recv()
+        except EOFError:
+            raise Exception("Transcription server process exited while handling the request")
+    if status == 'error':
+        raise Exception(value)
+    return value
+
+def remote_transcribe(model_size, audio, backend=None, **options):
+    """Transcribe in a transcription server process. audio is a file path or PcmSlice the server can read."""
+    return _request({'model_size': model_size, 'audio': audio, 'backend': backend, 'options': options})
+
+def server_listening():
+    """True when the server accepts connections. Doesn't wait for a free process, unlike a request."""
+    if not server_available():
+        return False
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.settimeout(1)
+            probe.connect(TRANSCRIBE_SERVER_SOCKET)
+        return True
+    except OSError:
+        return False
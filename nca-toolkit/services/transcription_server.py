@@ -0,0 +1,104 @@
+import os
+import gc
+import time
+import signal
+import logging
+import multiprocessing
+from multiprocessing.connection import Listener
+import torch
+from services import whisper_models
+from services.transcription_client import TRANSCRIBE_SERVER_SOCKET, authkey
+
+logger = logging.getLogger(__name__)
+
+# Processes transcribing at the same time; each handles one request at a time
+TRANSCRIBE_PROCESSES = int(os.environ.get('TRANSCRIBE_PROCESSES', 2))
+
+# Torch intra-op threads per process (0 = the CPU cores split evenly between the processes)
+TRANSCRIBE_TORCH_THREADS = int(os.environ.get('TRANSCRIBE_TORCH_THREADS', 0)) or max(1, (os.cpu_count() or 1) // max(TRANSCRIBE_PROCESSES, 1))
+
+def serve(listener):
+    """Answer requests from the shared listening socket until the process is stopped."""
+    # The parent's SIGTERM handler is inherited by the fork; a child just exits when terminated
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    torch.set_num_threads(TRANSCRIBE_TORCH_THREADS)
+    # Models of backends that can't be shared across a fork are loaded by each process
+    whisper_models.preload_models(fork_safe=False)
+    logger.info(f"Transcription process {os.getpid()} ready with {TRANSCRIBE_TORCH_THREADS} torch threads")
+    while True:
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError):
+            # Readiness probes connect and hang up without a request
+            continue
+        except multiprocessing.AuthenticationError as e:
+            logger.warning(f"Rejected transcription connection: {e}")
+            continue
+        with conn:
+            try:
+                request = conn.recv()
+            except (OSError, EOFError):
+                continue
+            start = time.time()
+            try:
+                reply = 'ok', whisper_models.transcribe_local(request['model_size'], request['audio'], request['backend'], **request['options'])
+            except Exception as e:
+                reply = 'error', f"{type(e).__name__}: {e}"
+            logger.info(f"Transcribed {request['audio']} with {request['backend'] or 'default'}:{request['model_size']} in {time.time() - start:.1f}s ({reply[0]})")
+            try:
+                conn.send(reply)
+            except (OSError, EOFError):
+                logger.warning("Client went away before the transcription finished")
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    # supervisord stops the server with SIGTERM; exit through the finally below so the children go too
+    signal.signal(signal.SIGTERM, _stop)
+    if os.path.exists(TRANSCRIBE_SERVER_SOCKET):
+        os.remove(TRANSCRIBE_SERVER_SOCKET)
+
+    # Models are loaded before forking so every process shares one copy of the weights
+    # (copy-on-write pages that inference only reads); models loaded later, or by backends
+    # that aren't fork safe, are per process
+    if not whisper_models.WHISPER_PRELOAD_MODELS:
+        logger.warning("WHISPER_PRELOAD_MODELS is empty: every process will load its own copy of each model")
+    whisper_models.preload_models(fork_safe=True)
+    gc.collect()
+    # Keep the garbage collector from writing to the inherited objects, which would copy their pages
+    gc.freeze()
+
+    # Bound only once the models are loaded, so clients fall back to transcribing themselves meanwhile
+    listener = Listener(TRANSCRIBE_SERVER_SOCKET, family='AF_UNIX', backlog=64, authkey=authkey())
+    os.chmod(TRANSCRIBE_SERVER_SOCKET, 0o600)
+    logger.info(f"Transcription server listening on {TRANSCRIBE_SERVER_SOCKET} with {TRANSCRIBE_PROCESSES} processes")
+
+    context = multiprocessing.get_context('fork')
+    processes = []
+    try:
+        while True:
+            for process in processes:
+                if not process.is_alive():
+                    logger.warning(f"Transcription process {process.pid} exited with code {process.exitcode}, restarting it")
+            processes = [process for process in processes if process.is_alive()]
+            while len(processes) < max(TRANSCRIBE_PROCESSES, 1):
+                process = context.Process(target=serve, args=(listener,), daemon=True)
+                process.start()
+                processes.append(process)
+            time.sleep(1)
+    finally:
+        # Children hold the model weights and the listening socket, so don't leave them running
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.kill()
+                process.join()
+        listener.close()
+        logger.info(f"Transcription server stopped with its {len(processes)} processes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.cloud_storage import upload_file, upload_files
+
+logger = logging.getLogger(__name__)
+
+# Concurrent uploads per worker for outputs handed off by finished jobs
+UPLOAD_WORKERS = int(os.environ.get('UPLOAD_WORKERS', 4))
+
+# Set to 'false' to upload outputs inside the job, holding its slot until the upload ends
+DEFERRED_UPLOADS = os.environ.get('DEFERRED_UPLOADS', 'true').lower() == 'true'
+
+PLACEHOLDER_PREFIX = 'deferred-upload://'
+
+_current_job = threading.local()
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def begin_deferred_uploads():
+    """Collect the uploads requested by the job running on this thread instead of running them."""
+    _current_job.uploads = {} if DEFERRED_UPLOADS else None
+
+def end_deferred_uploads():
+    """Return the uploads collected on this thread since begin_deferred_uploads(), by placeholder."""
+    uploads = getattr(_current_job, 'uploads', None) or {}
+    _current_job.uploads = None
+    return uploads
+
+def upload_later(file_path, remove=False, content_addressed=None):
+    """Upload a job output once the job's processing is done and return a placeholder for its URL.
+
+    The placeholder is replaced by the cloud URL wherever it appears in the job's response.
+    Outside a queued job (direct requests, or DEFERRED_UPLOADS off) the file is uploaded now
+    and the URL is returned. With remove set, the file is deleted after the upload.
+    content_addressed is passed on to upload_file.
+    """
+    uploads = getattr(_current_job, 'uploads', None)
+    if uploads is None:
+        url = upload_file(file_path, content_addressed)
+        if remove:
+            os.remove(file_path)
+        return url
+
+    placeholder = f"{PLACEHOLDER_PREFIX}{uuid.uuid4()}"
+    uploads[placeholder] = (file_path, remove, content_addressed, None)
+    return placeholder
+
+def upload_batch_later(file_paths, build, remove=False, content_addressed=None):
+    """Upload several job outputs once processing is done, returning one placeholder for build(urls, failures).
+
+    Unlike upload_later, a file that fails to upload doesn't fail the job: build gets the URLs in
+    the order of file_paths (None for failed files) and the failures listed by upload_files, and
+    its return value takes the placeholder's place. build may raise to fail the job. Outside a
+    queued job the files are uploaded now and build's value is returned.
+    """
+    uploads = getattr(_current_job, 'uploads', None)
+    if uploads is None:
+        urls, failures = upload_files(file_paths, content_addressed=content_addressed)
+        if remove:
+            for file_path in file_paths:
+                os.remove(file_path)
+        return build(urls, failures)
+
+    placeholder = f"{PLACEHOLDER_PREFIX}{uuid.uuid4()}"
+    uploads[placeholder] = (list(file_paths), remove, content_addressed, build)
+    return placeholder
+
+def discard_uploads(uploads):
+    """Delete the files of uploads marked for removal, once uploaded or when their job failed."""
+    for file_paths, remove, _, build in uploads.values():
+        if not remove:
+            continue
+        for file_path in (file_paths if build else [file_paths]):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+def resolve_placeholders(value, urls):
+    """Replace upload placeholders in a job response with their URLs."""
+    if isinstance(value, str):
+        return urls.get(value, value)
+    if isinstance(value, list):
+        return [resolve_placeholders(item, urls) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve_placeholders(item, urls) for key, item in value.items()}
+    return value
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=max(UPLOAD_WORKERS, 1), thread_name_prefix='upload')
+            _executor_pid = os.getpid()
+        return _executor
+
+def _run_uploads(uploads, job_id):
+    """Upload every file of a job. Returns (urls by placeholder, seconds, error or None)."""
+    start = time.time()
+    urls = {}
+    failures = []
+    error = None
+    files = {placeholder: upload for placeholder, upload in uploads.items() if upload[3] is None}
+    # One batch per naming mode, since upload_files names a whole batch the same way
+    for content_addressed in {upload[2] for upload in files.values()}:
+        placeholders = [placeholder for placeholder, upload in files.items() if upload[2] == content_addressed]
+        results, batch_failures = upload_files([files[placeholder][0] for placeholder in placeholders], content_addressed=content_addressed)
+        urls.update(zip(placeholders, results))
+        failures.extend(batch_failures)
+    # Batches report their own failures through build
+    for placeholder, (file_paths, _, content_addressed, build) in uploads.items():
+        if build is None:
+            continue
+        results, batch_failures = upload_files(file_paths, content_addressed=content_addressed)
+        try:
+            urls[placeholder] = build(results, batch_failures)
+        except Exception as e:
+            error = error or e
+    discard_uploads(uploads)
+    seconds = time.time() - start
+    if failures:
+        error = Exception(f"{failures[0]['file']}: {failures[0]['error']}")
+    if error is not None:
+        logger.error(f"Job {job_id}: Deferred upload failed - {error}")
+        return {}, seconds, error
+    return urls, seconds, None
+
+def submit_uploads(uploads, job_id, on_done):
+    """Run a job's uploads in the upload pool, then call on_done(urls, seconds, error) from the pool."""
+    def run():
+        start = time.time()
+        try:
+            urls, seconds, error = _run_uploads(uploads, job_id)
+        except Exception as e:
+            # The job must still finish (and release its workspace) when the uploads can't even start
+            logger.error(f"Job {job_id}: Deferred upload failed - {e}")
+            try:
+                discard_uploads(uploads)
+            except OSError:
+                pass
+            urls, seconds, error = {}, time.time() - start, e
+        try:
+            on_done(urls, seconds, error)
+        except Exception as e:
+            logger.error(f"Job {job_id}: Failed to complete job after upload - {e}")
+    logger.info(f"Job {job_id}: Handing {len(uploads)} output(s) to the upload stage")
+    _get_executor().submit(run)
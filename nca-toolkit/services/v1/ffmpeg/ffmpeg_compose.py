@@ -1,9 +1,8 @@
 import os
 import subprocess
 import json
-from services.file_management import download_file
-
-STORAGE_PATH = "/tmp/"
+from services.file_management import download_files, is_streamable, input_args, STREAM_INPUT_OPTIONS
+from services.workspace import workspace_dir
 
 def get_extension_from_format(format_name):
     # Mapping of common format names to file extensions
@@ -88,15 +87,27 @@ def process_ffmpeg_compose(data, job_id):
         if "argument" in option and option["argument"] is not None:
             command.append(str(option["argument"]))
     
+    # Inputs flagged with stream are read by ffmpeg from their URL when the container allows it;
+    # the rest are downloaded concurrently
+    streamed = [bool(input_data.get("stream")) and is_streamable(input_data["file_url"]) for input_data in data["inputs"]]
+    input_paths = download_files(
+        [input_data["file_url"] for input_data, stream in zip(data["inputs"], streamed) if not stream],
+        workspace_dir()
+    )
+    downloaded = iter(input_paths)
+
     # Add inputs
-    for input_data in data["inputs"]:
+    for input_data, stream in zip(data["inputs"], streamed):
         if "options" in input_data:
             for option in input_data["options"]:
                 command.append(option["option"])
                 if "argument" in option and option["argument"] is not None:
                     command.append(str(option["argument"]))
-        input_path = download_file(input_data["file_url"], STORAGE_PATH)
-        command.extend(["-i", input_path])
+        if stream:
+            command.extend(input_args(STREAM_INPUT_OPTIONS))
+            command.extend(["-i", input_data["file_url"]])
+        else:
+            command.extend(["-i", next(downloaded)])
     
     # Add filters
     if data.get("filters"):
@@ -118,10 +129,10 @@ def process_ffmpeg_compose(data, job_id):
             # Asegurar que tenga la extensión correcta
             if not base_filename.endswith(f".{extension}"):
                 base_filename = f"{base_filename}.{extension}"
-            output_filename = os.path.join(STORAGE_PATH, base_filename)
+            output_filename = os.path.join(workspace_dir(), base_filename)
         else:
             # Usar el nombre generado automáticamente como antes
-            output_filename = os.path.join(STORAGE_PATH, f"{job_id}_output_{i}.{extension}")
+            output_filename = os.path.join(workspace_dir(), f"{job_id}_output_{i}.{extension}")
         
         output_filenames.append(output_filename)
         
@@ -136,12 +147,11 @@ def process_ffmpeg_compose(data, job_id):
         subprocess.run(command, check=True, capture_output=True, text=True)
     except subprocess.CalledProcessError as e:
         raise Exception(f"FFmpeg command failed: {e.stderr}")
-    
-    # Clean up input files
-    for input_data in data["inputs"]:
-        input_path = os.path.join(STORAGE_PATH, os.path.basename(input_data["file_url"]))
-        if os.path.exists(input_path):
-            os.remove(input_path)
+    finally:
+        # Clean up the downloaded input files
+        for input_path in input_paths:
+            if os.path.exists(input_path):
+                os.remove(input_path)
     
     # Get metadata if requested
     metadata = []
@@ -2,17 +2,17 @@ import os
 import subprocess
 import logging
 from services.file_management import download_file
+from services.workspace import workspace_dir
 from PIL import Image
 import tempfile
 import shutil
 
-STORAGE_PATH = "/tmp/"
 logger = logging.getLogger(__name__)
 
 def process_image_to_video(image_url, length, frame_rate, zoom_speed, zoom_x, zoom_y, filename, webhook_url=None):
     try:
         # Download the image file
-        image_path = download_file(image_url, STORAGE_PATH)
+        image_path = download_file(image_url, workspace_dir())
         logger.info(f"Downloaded image to {image_path}")
 
         # Get image dimensions using Pillow
@@ -21,7 +21,7 @@ def process_image_to_video(image_url, length, frame_rate, zoom_speed, zoom_x, zo
         logger.info(f"Original image dimensions: {width}x{height}")
 
         # Prepare the output path
-        output_path = os.path.join(STORAGE_PATH, f"{filename}.mp4")
+        output_path = os.path.join(workspace_dir(), f"{filename}.mp4")
 
         # Determine orientation and set appropriate dimensions
         if width > height:
@@ -74,7 +74,7 @@ def process_image_to_video(image_url, length, frame_rate, zoom_speed, zoom_x, zo
 def process_image_to_video_2segments(image_url, length, frame_rate, zoom_speed, zoom_x, zoom_y, filename, webhook_url=None):
     try:
         # Download the image file
-        image_path = download_file(image_url, STORAGE_PATH)
+        image_path = download_file(image_url, workspace_dir())
         logger.info(f"Downloaded image to {image_path}")
 
         # Get image dimensions using Pillow
@@ -83,7 +83,7 @@ def process_image_to_video_2segments(image_url, length, frame_rate, zoom_speed,
         logger.info(f"Original image dimensions: {width}x{height}")
 
         # Create temporary directory for segments
-        temp_dir = tempfile.mkdtemp(dir=STORAGE_PATH)
+        temp_dir = tempfile.mkdtemp(dir=workspace_dir())
         
         # Determine orientation and set appropriate dimensions
         if width > height:
@@ -103,7 +103,7 @@ def process_image_to_video_2segments(image_url, length, frame_rate, zoom_speed,
         target_y = zoom_y if isinstance(zoom_y, str) else zoom_y * 4
         
         # Final output path
-        final_output_path = os.path.join(STORAGE_PATH, f"{filename}.mp4")
+        final_output_path = os.path.join(workspace_dir(), f"{filename}.mp4")
         
         # Create segment 1: Zoom in from center
         segment1_path = os.path.join(temp_dir, "segment1.mp4")
@@ -1,29 +1,27 @@
 import os
-import whisper
 import srt
 from datetime import timedelta
 from whisper.utils import WriteSRT, WriteVTT
 from services.file_management import download_file
+from services.workspace import workspace_dir
+from services.transcription_cache import transcribe_media
 import logging
 
 # Set up logging
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-# Set the default local storage directory
-STORAGE_PATH = "/tmp/"
+def process_transcribe_media(media_url, task, include_text, include_srt, include_segments, word_timestamps, response_type, language, job_id, model_size="medium", backend=None, long_media=False):
+    """Transcribe or translate media and return the transcript/translation, SRT and segments (or their
+    file paths), and the backend that produced them.
 
-def process_transcribe_media(media_url, task, include_text, include_srt, include_segments, word_timestamps, response_type, language, job_id, model_size="medium"):
-    """Transcribe or translate media and return the transcript/translation, SRT or VTT file path."""
+    With long_media, silences are skipped and the speech is transcribed as parallel chunks.
+    """
     logger.info(f"Starting {task} for media URL: {media_url} with model size: {model_size}")
-    input_filename = download_file(media_url, os.path.join(STORAGE_PATH, 'input_media'))
+    input_filename = download_file(media_url, workspace_dir())
     logger.info(f"Downloaded media to local file: {input_filename}")
 
     try:
-        # Use model size from request parameters
-        model = whisper.load_model(model_size)
-        logger.info(f"Loaded Whisper {model_size} model")
-
         # Configure transcription/translation options
         options = {
             "task": task,
@@ -35,14 +33,15 @@ def process_transcribe_media(media_url, task, include_text, include_srt, include
         if language:
             options["language"] = language
 
-        result = model.transcribe(input_filename, **options)
+        # Use model size from request parameters; the model is loaded once per worker
+        result = transcribe_media(model_size, input_filename, backend, long_media, **options)
         
         # For translation task, the result['text'] will be in English
         text = None
         srt_text = None
         segments_json = None
 
-        logger.info(f"Generated {task} output")
+        logger.info(f"Generated {task} output with {result['backend']}")
 
         if include_text is True:
             text = result['text']
@@ -66,31 +65,31 @@ def process_transcribe_media(media_url, task, include_text, include_srt, include
         logger.info(f"{task.capitalize()} successful, output type: {response_type}")
 
         if response_type == "direct":
-            return text, srt_text, segments_json
+            return text, srt_text, segments_json, result['backend']
         else:
             
             if include_text is True:
-                text_filename = os.path.join(STORAGE_PATH, f"{job_id}.txt")
+                text_filename = os.path.join(workspace_dir(), f"{job_id}.txt")
                 with open(text_filename, 'w') as f:
                     f.write(text)
             else:
                 text_file = None
             
             if include_srt is True:
-                srt_filename = os.path.join(STORAGE_PATH, f"{job_id}.srt")
+                srt_filename = os.path.join(workspace_dir(), f"{job_id}.srt")
                 with open(srt_filename, 'w') as f:
                     f.write(srt_text)
             else:
                 srt_filename = None
 
             if include_segments is True:
-                segments_filename = os.path.join(STORAGE_PATH, f"{job_id}.json")
+                segments_filename = os.path.join(workspace_dir(), f"{job_id}.json")
                 with open(segments_filename, 'w') as f:
                     f.write(str(segments_json))
             else:
                 segments_filename = None
 
-            return text_filename, srt_filename, segments_filename 
+            return text_filename, srt_filename, segments_filename, result['backend']
 
     except Exception as e:
         logger.error(f"{task.capitalize()} failed: {str(e)}")
@@ -1,16 +1,21 @@
 import os
 import ffmpeg
+import logging
 import requests
-from services.file_management import download_file
+import threading
+import subprocess
+from collections import deque
+from services.file_management import download_file, download_files, is_streamable, open_stream, MB
+from services.cloud_storage import upload_stream
+from services.workspace import workspace_dir
 
-# Set the default local storage directory
-STORAGE_PATH = "/tmp/"
+logger = logging.getLogger(__name__)
 
 def process_media_to_mp3(media_url, job_id, bitrate='128k', webhook_url=None):
     """Convert media to MP3 format with specified bitrate."""
-    input_filename = download_file(media_url, os.path.join(STORAGE_PATH, f"{job_id}_input"))
+    input_filename = download_file(media_url, os.path.join(workspace_dir(), f"{job_id}_input"))
     output_filename = f"{job_id}.mp3"
-    output_path = os.path.join(STORAGE_PATH, output_filename)
+    output_path = os.path.join(workspace_dir(), output_filename)
 
     try:
         # Convert media file to MP3 with specified bitrate
@@ -34,21 +39,111 @@ def process_media_to_mp3(media_url, job_id, bitrate='128k', webhook_url=None):
         print(f"Conversion failed: {str(e)}")
         raise
 
+class _PipelineOutput:
+    """ffmpeg's stdout as a readable stream that fails at EOF if the source or ffmpeg failed.
+
+    Raising instead of returning the last empty read makes the upload abort rather than
+    publish a truncated file.
+    """
+    def __init__(self, process, errors, stderr_lines, stderr_thread):
+        self.process = process
+        self.errors = errors
+        self.stderr_lines = stderr_lines
+        self.stderr_thread = stderr_thread
+
+    def read(self, size=-1):
+        data = self.process.stdout.read(size)
+        if size != 0 and not data:
+            self.process.wait()
+            if self.errors:
+                raise self.errors[0]
+            if self.process.returncode != 0:
+                self.stderr_thread.join(timeout=5)
+                raise RuntimeError(f"FFmpeg exited with {self.process.returncode}: {' '.join(self.stderr_lines)}")
+        return data
+
+def _feed(source, stdin, errors):
+    """Copy the HTTP source into ffmpeg's stdin."""
+    try:
+        for chunk in source.iter_content(chunk_size=MB):
+            stdin.write(chunk)
+    except BrokenPipeError:
+        # ffmpeg stopped reading; its exit status says why
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        source.close()
+        try:
+            stdin.close()
+        except BrokenPipeError:
+            pass
+
+def _drain(stderr, lines):
+    for line in iter(stderr.readline, b''):
+        lines.append(line.decode(errors='replace').strip())
+
+def process_media_to_mp3_pipeline(media_url, job_id, bitrate='128k'):
+    """Download, convert and upload at the same time and return the cloud URL of the MP3.
+
+    The HTTP source feeds ffmpeg's stdin and ffmpeg's stdout feeds a chunked upload, so the job
+    takes about as long as its slowest stage and nothing is written to disk. Sources that can't be
+    decoded front to back (MP4 with the moov atom at the end) are downloaded first.
+    """
+    input_filename = None
+    if not is_streamable(media_url):
+        input_filename = download_file(media_url, os.path.join(workspace_dir(), f"{job_id}_input"))
+
+    cmd = [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error',
+        '-i', input_filename or 'pipe:0',
+        '-vn', '-acodec', 'libmp3lame', '-b:a', bitrate,
+        '-f', 'mp3', 'pipe:1'
+    ]
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL if input_filename else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    errors = []
+    stderr_lines = deque(maxlen=20)
+    stderr_thread = threading.Thread(target=_drain, args=(process.stderr, stderr_lines), daemon=True)
+    threads = [stderr_thread]
+    try:
+        if not input_filename:
+            threads.append(threading.Thread(target=_feed, args=(open_stream(media_url), process.stdin, errors), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        cloud_url = upload_stream(_PipelineOutput(process, errors, stderr_lines, stderr_thread), f"{job_id}.mp3")
+        logger.info(f"Job {job_id}: Streamed MP3 conversion uploaded to {cloud_url}")
+        return cloud_url
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        for thread in threads:
+            if thread.is_alive():
+                thread.join(timeout=5)
+        if input_filename:
+            os.remove(input_filename)
+
 def process_video_combination(media_urls, job_id, webhook_url=None):
     """Combine multiple videos into one."""
     input_files = []
     output_filename = f"{job_id}.mp4"
-    output_path = os.path.join(STORAGE_PATH, output_filename)
+    output_path = os.path.join(workspace_dir(), output_filename)
 
     try:
-        # Download all media files
-        for i, media_item in enumerate(media_urls):
-            url = media_item['video_url']
-            input_filename = download_file(url, os.path.join(STORAGE_PATH, f"{job_id}_input_{i}"))
-            input_files.append(input_filename)
+        # Download all media files concurrently, keeping their order
+        input_files = download_files(
+            [media_item['video_url'] for media_item in media_urls],
+            [os.path.join(workspace_dir(), f"{job_id}_input_{i}") for i in range(len(media_urls))]
+        )
 
         # Generate an absolute path concat list file for FFmpeg
-        concat_file_path = os.path.join(STORAGE_PATH, f"{job_id}_concat_list.txt")
+        concat_file_path = os.path.join(workspace_dir(), f"{job_id}_concat_list.txt")
         with open(concat_file_path, 'w') as concat_file:
             for input_file in input_files:
                 # Write absolute paths to the concat list
@@ -2,12 +2,13 @@ import os
 import ffmpeg
 import logging
 import subprocess
-import whisper
 from datetime import timedelta
 import srt
 import re
 from services.file_management import download_file
 from services.cloud_storage import upload_file  # Ensure this import is present
+from services.workspace import workspace_dir
+from services.transcription_cache import transcribe_media
 import requests  # Ensure requests is imported for webhook handling
 from urllib.parse import urlparse
 import difflib
@@ -21,7 +22,6 @@ if not logger.hasHandlers():
     handler.setFormatter(formatter)
     logger.addHandler(handler)
 
-STORAGE_PATH = "/tmp/"
 
 POSITION_ALIGNMENT_MAP = {
     "bottom_left": 1,
@@ -49,14 +49,13 @@ def rgb_to_ass_color(rgb_color, alpha=None):
 
 def generate_transcription(video_path, language='auto'):
     try:
-        model = whisper.load_model("base")
         transcription_options = {
             'word_timestamps': True,
             'verbose': True,
         }
         if language != 'auto':
             transcription_options['language'] = language
-        result = model.transcribe(video_path, **transcription_options)
+        result = transcribe_media("base", video_path, **transcription_options)
         logger.info(f"Transcription generated successfully for video: {video_path}")
         return result
     except Exception as e:
@@ -914,7 +913,7 @@ def process_captioning_v1(video_url, captions, settings, replace, job_id, langua
 
         # Download the video
         try:
-            video_path = download_file(video_url, STORAGE_PATH)
+            video_path = download_file(video_url, workspace_dir())
             logger.info(f"Job {job_id}: Video downloaded to {video_path}")
         except Exception as e:
             logger.error(f"Job {job_id}: Video download error: {str(e)}")
@@ -975,7 +974,7 @@ def process_captioning_v1(video_url, captions, settings, replace, job_id, langua
 
         # Save the subtitle content
         subtitle_filename = f"{job_id}.{subtitle_type}"
-        subtitle_path = os.path.join(STORAGE_PATH, subtitle_filename)
+        subtitle_path = os.path.join(workspace_dir(), subtitle_filename)
         try:
             with open(subtitle_path, 'w', encoding='utf-8') as f:
                 f.write(subtitle_content)
@@ -986,7 +985,7 @@ def process_captioning_v1(video_url, captions, settings, replace, job_id, langua
 
         # Prepare output filename and path
         output_filename = f"{job_id}_captioned.mp4"
-        output_path = os.path.join(STORAGE_PATH, output_filename)
+        output_path = os.path.join(workspace_dir(), output_filename)
 
         # Process video with subtitles using FFmpeg
         try:
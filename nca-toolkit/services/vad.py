@@ -0,0 +1,77 @@
+import os
+import numpy as np
+from services.audio_pcm import SAMPLE_RATE
+
+# Frame length of the energy detector in seconds
+VAD_FRAME_SECONDS = 0.03
+
+# Frames louder than the noise floor (10th percentile of frame energy) by this many dB are speech
+VAD_THRESHOLD_DB = float(os.environ.get('VAD_THRESHOLD_DB', 12))
+
+# Pauses shorter than this are kept inside speech; speech shorter than VAD_MIN_SPEECH is dropped
+VAD_MIN_SILENCE = float(os.environ.get('VAD_MIN_SILENCE', 0.5))
+VAD_MIN_SPEECH = 0.25
+
+# Audio kept around each speech region so word edges aren't clipped
+VAD_PADDING = 0.2
+
+# Frames processed at a time, to bound the memory used on long inputs
+BLOCK_FRAMES = 100000
+
+def frame_energy(samples):
+    """Energy in dB of consecutive VAD_FRAME_SECONDS frames."""
+    frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    count = len(samples) // frame
+    energies = np.empty(count, dtype=np.float32)
+    for start in range(0, count, BLOCK_FRAMES):
+        end = min(start + BLOCK_FRAMES, count)
+        block = np.asarray(samples[start * frame:end * frame], dtype=np.float32).reshape(-1, frame)
+        energies[start:end] = 10 * np.log10(np.mean(block * block, axis=1) + 1e-10)
+    return energies
+
+def _runs(mask):
+    """(start, end) index ranges where a boolean array is True."""
+    padded = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(changes[::2], changes[1::2]))
+
+def speech_regions(samples):
+    """Sample ranges that contain speech, found by comparing frame energy with the noise floor."""
+    energies = frame_energy(samples)
+    if len(energies) == 0:
+        return []
+    threshold = np.percentile(energies, 10) + VAD_THRESHOLD_DB
+    speech = energies > threshold
+
+    # Bridge short pauses, then drop blips too short to be words
+    for start, end in _runs(~speech):
+        if start > 0 and end < len(speech) and (end - start) * VAD_FRAME_SECONDS < VAD_MIN_SILENCE:
+            speech[start:end] = True
+    frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    padding = int(VAD_PADDING * SAMPLE_RATE)
+    regions = []
+    for start, end in _runs(speech):
+        if (end - start) * VAD_FRAME_SECONDS < VAD_MIN_SPEECH:
+            continue
+        regions.append((max(int(start) * frame - padding, 0), min(int(end) * frame + padding, len(samples))))
+    return regions
+
+def plan_chunks(regions, max_samples, max_gap_samples):
+    """Group speech regions into chunks of at most max_samples, cutting only in silences.
+
+    Silences longer than max_gap_samples always end a chunk, so they are never transcribed.
+    Speech that runs longer than max_samples without a pause is cut at max_samples.
+    """
+    chunks = []
+    for start, end in regions:
+        if chunks:
+            # Padding can make neighbouring regions overlap
+            start = max(start, chunks[-1][1])
+        if chunks and start - chunks[-1][1] <= max_gap_samples and end - chunks[-1][0] <= max_samples:
+            chunks[-1] = (chunks[-1][0], end)
+            continue
+        while end - start > max_samples:
+            chunks.append((start, start + max_samples))
+            start += max_samples
+        chunks.append((start, end))
+    return chunks
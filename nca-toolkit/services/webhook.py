@@ -1,14 +1,227 @@
-import requests
+import os
+import json
+import time
+import queue
+import random
 import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from services.job_queue import get_connection, pid_alive, JOB_RETENTION
 
 logger = logging.getLogger(__name__)
 
+# Outbound delivery settings
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 1000))
+WEBHOOK_TIMEOUT = float(os.environ.get('WEBHOOK_TIMEOUT', 30))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_BACKOFF_BASE = float(os.environ.get('WEBHOOK_BACKOFF_BASE', 2))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get('WEBHOOK_BACKOFF_MAX', 600))
+
+# Client errors that are worth retrying; any other 4xx is treated as permanent
+RETRYABLE_STATUS_CODES = {408, 425, 429}
+
+_outbound = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+_session = None
+_started = False
+_start_lock = threading.Lock()
+_metrics_lock = threading.Lock()
+_metrics = {
+    "accepted": 0,
+    "attempts": 0,
+    "delivered": 0,
+    "retried": 0,
+    "failed": 0,
+    "delivery_time_total": 0.0,
+}
+
+def _get_session():
+    """One keep-alive session for all deliveries; requests keeps a connection pool per host."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=WEBHOOK_WORKERS)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _session = session
+    return _session
+
+def _count(name, value=1):
+    with _metrics_lock:
+        _metrics[name] += value
+
+def _init_delivery_log():
+    conn = get_connection()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS webhook_deliveries (
+            delivery_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT,
+            url TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            delivered_at REAL,
+            pid INTEGER
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS webhook_deliveries_due ON webhook_deliveries (status, next_attempt_at)")
+
+    # Deliveries a dead worker was sending go back to pending
+    for row in conn.execute("SELECT delivery_id, pid FROM webhook_deliveries WHERE status = 'sending'").fetchall():
+        if not pid_alive(row['pid']):
+            conn.execute("UPDATE webhook_deliveries SET status = 'pending', pid = NULL WHERE delivery_id = ?", (row['delivery_id'],))
+    conn.execute(
+        "DELETE FROM webhook_deliveries WHERE status IN ('delivered', 'failed') AND created_at < ?",
+        (time.time() - JOB_RETENTION,)
+    )
+
+def start_webhook_dispatcher():
+    """Create the delivery log and start the delivery and retry threads once per process."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _init_delivery_log()
+        for _ in range(max(WEBHOOK_WORKERS, 1)):
+            threading.Thread(target=_deliver_loop, daemon=True).start()
+        threading.Thread(target=_retry_loop, daemon=True).start()
+        _started = True
+
+def _claim(delivery_id):
+    """Mark a pending delivery as being sent by this worker. Returns False if another worker got it first."""
+    cursor = get_connection().execute(
+        "UPDATE webhook_deliveries SET status = 'sending', pid = ? WHERE delivery_id = ? AND status = 'pending'",
+        (os.getpid(), delivery_id)
+    )
+    return cursor.rowcount == 1
+
+def _release(delivery_id):
+    get_connection().execute(
+        "UPDATE webhook_deliveries SET status = 'pending', pid = NULL WHERE delivery_id = ?",
+        (delivery_id,)
+    )
+
+def _hand_off(delivery_id):
+    """Queue a claimed delivery for the local workers, or release it for later if the queue is full."""
+    try:
+        _outbound.put_nowait(delivery_id)
+        return True
+    except queue.Full:
+        _release(delivery_id)
+        return False
+
 def send_webhook(webhook_url, data):
-    """Send a POST request to a webhook URL with the provided data."""
+    """Record a webhook delivery and hand it to the background dispatcher without waiting for it."""
+    if not webhook_url:
+        return
+    start_webhook_dispatcher()
+
+    now = time.time()
+    cursor = get_connection().execute(
+        "INSERT INTO webhook_deliveries (job_id, url, payload, status, next_attempt_at, created_at) VALUES (?, ?, ?, 'pending', ?, ?)",
+        (data.get('job_id'), webhook_url, json.dumps(data, default=str), now, now)
+    )
+    _count("accepted")
+    logger.info(f"Queued webhook to {webhook_url} for job {data.get('job_id')}")
+
+    if _claim(cursor.lastrowid):
+        _hand_off(cursor.lastrowid)
+
+def _deliver_loop():
+    while True:
+        delivery_id = _outbound.get()
+        try:
+            _deliver(delivery_id)
+        except Exception as e:
+            logger.error(f"Webhook delivery {delivery_id} crashed: {e}")
+            _release(delivery_id)
+
+def _deliver(delivery_id):
+    conn = get_connection()
+    row = conn.execute("SELECT * FROM webhook_deliveries WHERE delivery_id = ?", (delivery_id,)).fetchone()
+    if row is None or row['status'] != 'sending':
+        return
+
+    attempts = row['attempts'] + 1
+    start = time.time()
+    _count("attempts")
     try:
-        logger.info(f"Attempting to send webhook to {webhook_url} with data: {data}")
-        response = requests.post(webhook_url, json=data)
+        response = _get_session().post(
+            row['url'],
+            data=row['payload'],
+            headers={'Content-Type': 'application/json'},
+            timeout=WEBHOOK_TIMEOUT
+        )
         response.raise_for_status()
-        logger.info(f"Webhook sent: {data}")
     except requests.RequestException as e:
-        logger.error(f"Webhook failed: {e}")
+        status_code = e.response.status_code if e.response is not None else None
+        permanent = status_code is not None and 400 <= status_code < 500 and status_code not in RETRYABLE_STATUS_CODES
+        if permanent or attempts >= WEBHOOK_MAX_ATTEMPTS:
+            conn.execute(
+                "UPDATE webhook_deliveries SET status = 'failed', attempts = ?, last_error = ?, pid = NULL WHERE delivery_id = ?",
+                (attempts, str(e), delivery_id)
+            )
+            _count("failed")
+            logger.error(f"Webhook to {row['url']} failed permanently after {attempts} attempts: {e}")
+        else:
+            delay = min(WEBHOOK_BACKOFF_BASE * 2 ** (attempts - 1), WEBHOOK_BACKOFF_MAX)
+            delay *= random.uniform(0.8, 1.2)
+            conn.execute(
+                "UPDATE webhook_deliveries SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?, pid = NULL WHERE delivery_id = ?",
+                (attempts, time.time() + delay, str(e), delivery_id)
+            )
+            _count("retried")
+            logger.warning(f"Webhook to {row['url']} failed (attempt {attempts}), retrying in {delay:.1f}s: {e}")
+        return
+
+    elapsed = time.time() - start
+    conn.execute(
+        "UPDATE webhook_deliveries SET status = 'delivered', attempts = ?, delivered_at = ?, last_error = NULL, pid = NULL WHERE delivery_id = ?",
+        (attempts, time.time(), delivery_id)
+    )
+    _count("delivered")
+    _count("delivery_time_total", elapsed)
+    logger.info(f"Webhook sent to {row['url']} for job {row['job_id']} in {elapsed:.3f}s")
+
+def _retry_loop():
+    """Pick up due retries and deliveries that didn't fit in the queue, from any worker."""
+    while True:
+        time.sleep(1)
+        try:
+            free = WEBHOOK_QUEUE_SIZE - _outbound.qsize()
+            if free <= 0:
+                continue
+            due = get_connection().execute(
+                "SELECT delivery_id FROM webhook_deliveries WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT ?",
+                (time.time(), free)
+            ).fetchall()
+            for row in due:
+                if _claim(row['delivery_id']) and not _hand_off(row['delivery_id']):
+                    break
+        except Exception as e:
+            logger.error(f"Webhook retry scan failed: {e}")
+
+def get_webhook_metrics():
+    """Delivery counters for this worker plus the state of the shared delivery log."""
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    metrics["average_delivery_time"] = round(metrics.pop("delivery_time_total") / metrics["delivered"], 3) if metrics["delivered"] else None
+    metrics["outbound_queue_length"] = _outbound.qsize()
+    metrics["pid"] = os.getpid()
+
+    rows = get_connection().execute("SELECT status, COUNT(*) AS count FROM webhook_deliveries GROUP BY status").fetchall()
+    metrics["deliveries"] = {row['status']: row['count'] for row in rows}
+    return metrics
+
+def list_failed_deliveries(limit=100):
+    rows = get_connection().execute(
+        "SELECT delivery_id, job_id, url, attempts, last_error, created_at FROM webhook_deliveries "
+        "WHERE status = 'failed' ORDER BY delivery_id DESC LIMIT ?",
+        (limit,)
+    ).fetchall()
+    return [dict(row) for row in rows]
@@ -0,0 +1,190 @@
+import os
+import gc
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from services.transcription_backends import get_backend
+from services.audio_pcm import resolve_audio
+from services.transcription_client import (
+    TRANSCRIBE_SERVER, TRANSCRIBE_SERVER_SOCKET, TranscriptionServerUnavailable, server_available, server_listening, remote_transcribe
+)
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Comma-separated model sizes loaded at startup, e.g. "base,medium", with the default backend or a
+# named one ("faster-whisper:medium"). The transcription server loads them before forking so its
+# processes share the weights; 'base' is what captions use. Set to an empty value to load on demand.
+WHISPER_PRELOAD_MODELS = [size.strip() for size in os.environ.get('WHISPER_PRELOAD_MODELS', 'base').split(',') if size.strip()]
+
+# RAM the loaded models may take per process; least recently used idle models are unloaded beyond it
+WHISPER_MODEL_MEMORY_BUDGET = float(os.environ.get('WHISPER_MODEL_MEMORY_GB', 8)) * GB
+
+class _LoadedModel:
+    def __init__(self, backend, model, memory):
+        self.backend = backend
+        self.model = model
+        # openai-whisper installs hooks on the model for its key/value cache, so one job uses it at a time
+        self.lock = threading.Lock()
+        self.users = 0
+        self.last_used = time.time()
+        self.memory = memory
+
+_models = {}
+_loading = {}
+_registry_lock = threading.Lock()
+_preload_done = threading.Event()
+_preload_error = None
+
+def _model_memory():
+    return sum(entry.memory for entry in _models.values())
+
+def _evict(keep):
+    """Unload least recently used idle models until the loaded ones fit in the budget. Registry lock held."""
+    for key, entry in sorted(_models.items(), key=lambda item: item[1].last_used):
+        if _model_memory() <= WHISPER_MODEL_MEMORY_BUDGET:
+            break
+        if key == keep or entry.users:
+            continue
+        del _models[key]
+        logger.info(f"Unloaded {key} model to stay within WHISPER_MODEL_MEMORY_GB")
+    gc.collect()
+
+def _acquire(model_size, backend_name=None):
+    """Registry entry of a model, loading it if needed, counted as in use until _release()."""
+    backend_name, backend = get_backend(backend_name)
+    key = f"{backend_name}:{model_size}"
+    while True:
+        with _registry_lock:
+            entry = _models.get(key)
+            if entry is not None:
+                entry.users += 1
+                return entry
+            loading = _loading.get(key)
+            if loading is None:
+                loading = _loading[key] = threading.Event()
+                break
+        # Another thread is loading this model; use its copy once it's there
+        loading.wait()
+
+    try:
+        start = time.time()
+        model = backend.load(model_size)
+        entry = _LoadedModel(backend_name, model, backend.memory(model, model_size))
+        logger.info(f"Loaded {key} model in {time.time() - start:.1f}s ({entry.memory / GB:.1f} GB)")
+        with _registry_lock:
+            _models[key] = entry
+            entry.users += 1
+            _evict(keep=key)
+        return entry
+    finally:
+        with _registry_lock:
+            del _loading[key]
+        loading.set()
+
+def _release(entry):
+    with _registry_lock:
+        entry.users -= 1
+        entry.last_used = time.time()
+
+@contextmanager
+def use_model(model_size, backend=None):
+    """Exclusive use of a model, loaded once per process and shared by every job. Yields (backend, model)."""
+    entry = _acquire(model_size, backend)
+    try:
+        with entry.lock:
+            yield get_backend(entry.backend)[1], entry.model
+    finally:
+        _release(entry)
+
+def transcribe_local(model_size, audio, backend=None, **options):
+    """Transcribe with this process's shared model. The result says which backend produced it."""
+    backend_name, _ = get_backend(backend)
+    with use_model(model_size, backend_name) as (engine, model):
+        result = engine.transcribe(model, resolve_audio(audio), **options)
+    result['backend'] = backend_name
+    return result
+
+def transcribe(model_size, audio, backend=None, **options):
+    """Transcribe in the transcription server, or in this process when the server isn't running.
+
+    audio is a file path or a PcmSlice of decoded audio. backend picks the engine (TRANSCRIBE_BACKEND
+    by default); every engine returns openai-whisper's result schema, plus the name of the backend.
+    """
+    if server_available():
+        try:
+            return remote_transcribe(model_size, audio, backend=backend, **options)
+        except TranscriptionServerUnavailable as e:
+            logger.warning(f"{e}; transcribing in this worker instead")
+    return transcribe_local(model_size, audio, backend, **options)
+
+def preload_entries():
+    """(backend, model size) of each model in WHISPER_PRELOAD_MODELS."""
+    entries = []
+    for name in WHISPER_PRELOAD_MODELS:
+        backend, _, model_size = name.rpartition(':')
+        entries.append((get_backend(backend or None)[0], model_size))
+    return entries
+
+def preload_models(fork_safe=None):
+    """Load WHISPER_PRELOAD_MODELS now, or only those whose backend's fork_safe matches."""
+    global _preload_error
+    try:
+        for backend, model_size in preload_entries():
+            if fork_safe is not None and get_backend(backend)[1].fork_safe != fork_safe:
+                continue
+            entry = _acquire(model_size, backend)
+            _release(entry)
+    except Exception as e:
+        _preload_error = str(e)
+        logger.error(f"Failed to preload Whisper models: {e}")
+    finally:
+        _preload_done.set()
+
+def start_preload():
+    """Load WHISPER_PRELOAD_MODELS in the background; models_ready() turns true when they're loaded.
+
+    When the transcription server is enabled it holds the models, and workers only load one if
+    they have to fall back to transcribing themselves.
+    """
+    if not WHISPER_PRELOAD_MODELS or TRANSCRIBE_SERVER:
+        _preload_done.set()
+        return
+    threading.Thread(target=preload_models, daemon=True).start()
+
+def models_ready():
+    return _preload_done.is_set() and _preload_error is None
+
+def model_status():
+    """Readiness and loaded models of this process, and of the transcription server when it is enabled."""
+    status = local_model_status()
+    if TRANSCRIBE_SERVER:
+        # The server only listens once its preloaded models are loaded
+        listening = server_listening()
+        status["server"] = {"socket": TRANSCRIBE_SERVER_SOCKET, "listening": listening}
+        status["ready"] = listening
+    return status
+
+def local_model_status():
+    """Readiness and loaded models of this process."""
+    with _registry_lock:
+        loaded = {
+            key: {
+                "memory_gb": round(entry.memory / GB, 2),
+                "in_use": entry.users,
+                "last_used": entry.last_used,
+            }
+            for key, entry in _models.items()
+        }
+        loading = list(_loading)
+    return {
+        "ready": models_ready(),
+        "preload": WHISPER_PRELOAD_MODELS,
+        "preload_error": _preload_error,
+        "loaded": loaded,
+        "loading": loading,
+        "memory_budget_gb": round(WHISPER_MODEL_MEMORY_BUDGET / GB, 2),
+        "pid": os.getpid(),
+    }
@@ -0,0 +1,140 @@
+import os
+import fcntl
+import shutil
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+GB = 1024 ** 3
+
+# Every job gets its own directory under WORKSPACE_ROOT, removed when the job is done.
+# Keep it on the same filesystem as the download cache so cached inputs can be hardlinked.
+WORKSPACE_ROOT = os.environ.get('WORKSPACE_ROOT', '/tmp/nca_jobs')
+
+# Bytes a job may hold in its workspace before its downloads are refused (0 = no limit)
+WORKSPACE_QUOTA = float(os.environ.get('WORKSPACE_QUOTA_GB', 20)) * GB
+
+# Scratch directory for work done outside a job, emptied of old files by the janitor
+SHARED_SCRATCH = os.path.join(WORKSPACE_ROOT, 'shared')
+
+_current_job = threading.local()
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+class Workspace:
+    """A job's scratch directory, locked for as long as the job is alive.
+
+    The lock is a shared flock on the directory, so it is released by the kernel when the
+    worker process dies (a gunicorn timeout or a crash) and the janitor can reclaim the files.
+    """
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.path = os.path.join(WORKSPACE_ROOT, job_id)
+        while True:
+            os.makedirs(self.path, exist_ok=True)
+            self._fd = os.open(self.path, os.O_RDONLY)
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+            # The janitor may have locked and removed the new directory before us; start over if so
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+
+    def remove(self):
+        """Delete the workspace and everything in it."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+def open_workspace(job_id):
+    """Create the workspace of the job running on this thread; services find it with workspace_dir()."""
+    workspace = Workspace(job_id)
+    _current_job.workspace = workspace
+    return workspace
+
+def detach_workspace():
+    """Stop using the current workspace on this thread and return it, for the caller to remove later."""
+    workspace = getattr(_current_job, 'workspace', None)
+    _current_job.workspace = None
+    return workspace
+
+def close_workspace(workspace):
+    """Remove a job's workspace once its outputs are uploaded or the job has failed."""
+    if workspace is not None:
+        workspace.remove()
+
+def workspace_dir():
+    """Directory for the scratch files of the job running on this thread, with a trailing slash."""
+    workspace = getattr(_current_job, 'workspace', None)
+    if workspace is None:
+        os.makedirs(SHARED_SCRATCH, exist_ok=True)
+        return os.path.join(SHARED_SCRATCH, '')
+    return os.path.join(workspace.path, '')
+
+def _job_directory(path):
+    """Workspace directory a path belongs to, or None when it isn't inside a job workspace."""
+    relative = os.path.relpath(os.path.abspath(path), WORKSPACE_ROOT)
+    first = relative.split(os.sep)[0]
+    if first in ('.', '..', 'shared') or relative.startswith('..'):
+        return None
+    return os.path.join(WORKSPACE_ROOT, first)
+
+def directory_usage(path):
+    """Bytes held by the files under a directory."""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+def check_quota(path):
+    """Raise WorkspaceQuotaExceeded when the workspace holding path is over WORKSPACE_QUOTA."""
+    job_directory = _job_directory(path)
+    if WORKSPACE_QUOTA <= 0 or job_directory is None:
+        return
+    used = directory_usage(job_directory)
+    if used > WORKSPACE_QUOTA:
+        raise WorkspaceQuotaExceeded(
+            f"Job workspace holds {used / GB:.1f} GB, over the {WORKSPACE_QUOTA / GB:.1f} GB quota (WORKSPACE_QUOTA_GB)"
+        )
+
+def clean_orphaned_workspaces():
+    """Remove workspaces whose job no longer holds their lock. Returns the number removed.
+
+    Also logs live workspaces that have grown past the quota.
+    """
+    if not os.path.isdir(WORKSPACE_ROOT):
+        return 0
+    removed = 0
+    for entry in os.scandir(WORKSPACE_ROOT):
+        if not entry.is_dir(follow_symlinks=False) or entry.name == 'shared':
+            continue
+        try:
+            fd = os.open(entry.path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # The job is still running (or uploading its outputs)
+                if WORKSPACE_QUOTA > 0:
+                    used = directory_usage(entry.path)
+                    if used > WORKSPACE_QUOTA:
+                        logger.warning(f"Job {entry.name}: Workspace holds {used / GB:.1f} GB, over the quota")
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+        finally:
+            os.close(fd)
+    if removed:
+        logger.info(f"Removed {removed} workspaces left behind by finished or killed jobs")
+    return removed